@@ -9,81 +9,143 @@ import asyncio
 import threading 
 import os 
 import shutil 
+import atexit
+import contextlib
+import hmac
+import logging
+import queue
+import random
+import functools
+import math
+import operator
+import struct
+import concurrent.futures
+import collections
 
 # --- Configuration ---
 DATABASE_NAME = "ai_study_assistant.db"
 GEMINI_API_KEY = "" # For all Gemini features (Quiz, Helper, Chat)
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta/models"
+GEMINI_MODELS = ("gemini-2.0-flash", "gemini-2.0-flash-lite")
+MODEL_FOR_MODE = {"explain": "gemini-2.0-flash", "quiz": "gemini-2.0-flash", "chat": "gemini-2.0-flash",
+                  "summarize": "gemini-2.0-flash-lite", "practice_questions": "gemini-2.0-flash-lite", "quote": "gemini-2.0-flash-lite"} # Lite where the task is short-form
 APP_VERSION = "1.3.4" # Updated app version for schema fix
+SEM_CACHE_MODEL = "text-embedding-004" # Embeds AI Helper topics for the similarity cache (768 values)
+SEM_CACHE_THRESHOLD = 0.92 # Cosine similarity at or above which a cached answer is reused for a reworded prompt
+SEM_CACHE_SCAN = 500 # Most recent embeddings compared per lookup (and kept per mode/model)
+SCHEMA_VERSION = "7" # Bump whenever init_db gains a table, column or index
+log = logging.getLogger(__name__) # Diagnostics; run with logging at DEBUG to see them
+json_compact = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode # Built once; no padding or \u escapes in stored blobs
 
 # --- Database Manager ---
 class DatabaseManager:
     def __init__(self, db_name):
         self.db_name = db_name
-        self.conn = None
-        self.cursor = None
-
-    def connect(self):
-        self.conn = sqlite3.connect(self.db_name, timeout=10) 
-        self.cursor = self.conn.cursor()
-        self.cursor.execute("PRAGMA foreign_keys = ON;") 
+        self._local = threading.local() # One long-lived connection per thread
+        self._conns = []; self._conns_lock = threading.Lock()
+        self._categories = {} # user_id -> category list; dropped by every category write
+        atexit.register(self.close)
+
+    def _get_conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_name, timeout=10, check_same_thread=False, cached_statements=256)
+            if self.db_name != ":memory:": # WAL/mmap tuning only applies to file-backed databases
+                conn.execute("PRAGMA journal_mode = WAL;"); conn.execute("PRAGMA synchronous = NORMAL;")
+                conn.execute("PRAGMA temp_store = MEMORY;"); conn.execute("PRAGMA cache_size = -65536;") # 64 MiB
+                conn.execute("PRAGMA mmap_size = 268435456;"); conn.execute("PRAGMA busy_timeout = 3000;") # 256 MiB
+            conn.execute("PRAGMA foreign_keys = ON;")
+            self._local.conn = conn
+            with self._conns_lock: self._conns.append(conn)
+        return conn
 
     def close(self):
-        if self.conn:
-            self.conn.close()
-            self.conn = None 
-            self.cursor = None 
+        """Closes every connection opened by any thread; the next query reconnects."""
+        with self._conns_lock:
+            for conn in self._conns: conn.close()
+            self._conns = []
+        self._local = threading.local(); self._categories.clear() # A restored file may hold different categories
+
+    def checkpoint(self):
+        """Folds the WAL file back into the main database file (needed before copying it)."""
+        return self.fetch_one("PRAGMA wal_checkpoint(TRUNCATE);")
+
+    def _run(self, query, params=(), fetch=None):
+        """Runs one statement on this thread's connection; its statement cache is keyed by the SQL text."""
+        conn = self._get_conn()
+        if fetch == "one": return conn.execute(query, params).fetchone()
+        if fetch == "all": return conn.execute(query, params).fetchall()
+        with self._tx(conn): # Commits on success, rolls back on error
+            return conn.execute(query, params)
+
+    def _tx(self, conn):
+        """Write scope for one logical change: the connection itself (commit/rollback), or inside batch() a savepoint,
+        so a failing write undoes only its own statements and the batch commits once."""
+        return self._savepoint(conn) if getattr(self._local, "batch", False) else conn
+
+    @contextlib.contextmanager
+    def _savepoint(self, conn):
+        conn.execute("SAVEPOINT w")
+        try: yield conn
+        except BaseException: conn.execute("ROLLBACK TO w"); conn.execute("RELEASE w"); raise
+        else: conn.execute("RELEASE w")
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Groups this thread's writes into one transaction with a single commit at the end (see DBWorker.run).
+        IMMEDIATE takes the write lock up front (waiting out busy_timeout): a deferred BEGIN would start a read snapshot
+        on the first SELECT, and a later write in the batch fails with SQLITE_BUSY_SNAPSHOT if another connection committed."""
+        conn = self._get_conn(); conn.execute("BEGIN IMMEDIATE"); self._local.batch = True
+        try: yield; conn.commit()
+        except BaseException: # Includes a failed commit: never leave the connection inside the transaction
+            try: conn.rollback()
+            except sqlite3.Error: pass
+            raise
+        finally: self._local.batch = False
 
     def execute_query(self, query, params=()):
         try:
-            self.connect()
-            self.cursor.execute(query, params)
-            self.conn.commit()
-            return self.cursor 
+            return self._run(query, params)
         except sqlite3.Error as e:
             print(f"Database execution error: {e} with query: {query} and params: {params}")
             return None
-        finally:
-            self.close()
+
+    def executemany(self, query, seq_of_params):
+        """Runs one statement for every parameter tuple inside a single transaction."""
+        try:
+            conn = self._get_conn()
+            with self._tx(conn):
+                return conn.executemany(query, seq_of_params)
+        except sqlite3.Error as e:
+            log.warning("Database executemany error: %s with query: %s", e, query)
+            return None
 
     def fetch_one(self, query, params=()):
         try:
-            self.connect()
-            self.cursor.execute(query, params)
-            return self.cursor.fetchone()
+            return self._run(query, params, fetch="one")
         except sqlite3.Error as e:
             print(f"Database fetch_one error: {e} with query: {query} and params: {params}")
             return None
-        finally:
-            self.close()
 
     def fetch_all(self, query, params=()):
         try:
-            self.connect()
-            self.cursor.execute(query, params)
-            return self.cursor.fetchall()
+            return self._run(query, params, fetch="all")
         except sqlite3.Error as e:
             print(f"Database fetch_all error: {e} with query: {query} and params: {params}")
             return None
-        finally:
-            self.close()
-
-    def _table_exists(self, cursor, table_name):
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-        return cursor.fetchone() is not None
-
-    def _column_exists(self, cursor, table_name, column_name):
-        if not self._table_exists(cursor, table_name):
-            return False
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        columns = [info[1] for info in cursor.fetchall()]
-        return column_name in columns
-
-    def _try_add_column(self, cursor, table_name, column_definition_sql, column_name_for_check):
-        """Helper to attempt adding a column, using the full ADD COLUMN SQL."""
-        if self._table_exists(cursor, table_name) and not self._column_exists(cursor, table_name, column_name_for_check):
+
+    def _read_schema(self, cursor):
+        """Returns {table_name: set(column_names)} for every table, in one introspection pass."""
+        tables = [row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()]
+        return {t: {info[1] for info in cursor.execute(f"PRAGMA table_xinfo({t})").fetchall()} for t in tables}
+
+    def _try_add_column(self, cursor, schema, table_name, column_definition_sql, column_name_for_check):
+        """Helper to attempt adding a column, using the full ADD COLUMN SQL. `schema` comes from _read_schema."""
+        if table_name in schema and column_name_for_check not in schema[table_name]:
             try:
                 print(f"Migrating {table_name} table: Attempting to add column '{column_name_for_check}' with definition: {column_definition_sql}")
                 cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_definition_sql}")
+                schema[table_name].add(column_name_for_check)
                 print(f"Successfully executed ALTER TABLE for {column_name_for_check} on {table_name}.")
                 return True 
             except sqlite3.OperationalError as e:
@@ -96,33 +158,35 @@ class DatabaseManager:
             except sqlite3.Error as e:
                 print(f"General SQLite Error during '{column_name_for_check}' column migration for {table_name}: {e}")
                 raise 
-        elif self._column_exists(cursor, table_name, column_name_for_check):
-            # This case means the column already exists, so no action needed for adding.
-            # print(f"Column '{column_name_for_check}' already present in '{table_name}'.")
-            pass
         return False
 
     def init_db(self):
-        conn = sqlite3.connect(self.db_name)
+        conn = self._get_conn() # Shares the one-time connection setup (PRAGMAs) with every other query
         cursor = conn.cursor()
-        cursor.execute("PRAGMA foreign_keys = ON;")
+        try: # Fast start: nothing to migrate or create when the stored schema version is current
+            row = cursor.execute("SELECT value FROM config WHERE key = 'schema_version'").fetchone()
+            if row and row[0] == SCHEMA_VERSION: return
+        except sqlite3.OperationalError: pass # No config table yet (fresh database)
         
-        made_schema_changes = False
+        made_schema_changes = False; migration_ok = True
         try:
-            if self._try_add_column(cursor, "tasks", "category TEXT DEFAULT 'General'", "category"):
+            schema = self._read_schema(cursor)
+            if self._try_add_column(cursor, schema, "tasks", "category TEXT DEFAULT 'General'", "category"):
                 made_schema_changes = True
             # Corrected ALTER TABLE for created_at: SQLite doesn't support CURRENT_TIMESTAMP as DEFAULT in ALTER ADD.
             # The INSERT statement will handle CURRENT_TIMESTAMP.
-            if self._try_add_column(cursor, "tasks", "created_at TEXT", "created_at"):
+            if self._try_add_column(cursor, schema, "tasks", "created_at TEXT", "created_at"):
+                made_schema_changes = True
+            if self._try_add_column(cursor, schema, "quiz_attempts", "questions_data TEXT", "questions_data"):
                 made_schema_changes = True
-            if self._try_add_column(cursor, "quiz_attempts", "questions_data TEXT", "questions_data"):
+            if self._try_add_column(cursor, schema, "study_logs", "start_date TEXT GENERATED ALWAYS AS (substr(start_time, 1, 10)) VIRTUAL", "start_date"):
                 made_schema_changes = True
             
             if made_schema_changes:
                 conn.commit()
                 print("Schema migration changes (ALTER TABLE) committed.")
         except sqlite3.Error as e:
-            print(f"Error during schema migration (ALTER TABLE): {e}")
+            print(f"Error during schema migration (ALTER TABLE): {e}"); migration_ok = False
         
         queries = [
             """
@@ -161,6 +225,7 @@ class DatabaseManager:
                 start_time TEXT NOT NULL, 
                 duration_minutes INTEGER NOT NULL,
                 notes TEXT,
+                start_date TEXT GENERATED ALWAYS AS (substr(start_time, 1, 10)) VIRTUAL,
                 FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
             );
             """,
@@ -203,51 +268,106 @@ class DatabaseManager:
                 timestamp TEXT DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
             );
+            """,
             """
+            CREATE TABLE IF NOT EXISTS ai_cache (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                ttl REAL NOT NULL
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS ai_sem_cache (
+                id INTEGER PRIMARY KEY,
+                mode TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                emb BLOB NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                ttl REAL NOT NULL
+            );
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_tasks_user_due ON tasks(user_id, completed, due_date);",
+            "CREATE INDEX IF NOT EXISTS idx_tasks_user_created ON tasks(user_id, created_at DESC);",
+            "CREATE INDEX IF NOT EXISTS idx_tasks_user_status_cat ON tasks(user_id, completed, category, due_date);", # Task Manager filters
+            "CREATE INDEX IF NOT EXISTS idx_chat_user_ts ON ai_chat_history(user_id, timestamp DESC);",
+            "CREATE INDEX IF NOT EXISTS idx_study_user_start ON study_logs(user_id, start_time DESC);",
+            "CREATE INDEX IF NOT EXISTS idx_study_user_date ON study_logs(user_id, start_date);",
+            "CREATE INDEX IF NOT EXISTS idx_study_user_subject ON study_logs(user_id, subject, duration_minutes);", # Covers the per-subject totals
+            "CREATE INDEX IF NOT EXISTS idx_quiz_user_date ON quiz_attempts(user_id, quiz_date DESC);",
+            "CREATE INDEX IF NOT EXISTS idx_ai_user_created ON ai_generated_content(user_id, type, created_at DESC);",
+            "CREATE INDEX IF NOT EXISTS idx_ai_user_recent ON ai_generated_content(user_id, created_at DESC);", # Review Hub list (no type filter)
+            "CREATE INDEX IF NOT EXISTS idx_ai_cache_expiry ON ai_cache(created_at + ttl);", # Expiry sweep on every cache write
+            "CREATE INDEX IF NOT EXISTS idx_ai_sem_scope ON ai_sem_cache(mode, model, id DESC);", # Newest-first scan per mode/model
+            "ANALYZE;" # Refresh planner statistics so the indexes above get used
         ]
         try:
             for query in queries:
                 cursor.execute(query)
+            if migration_ok: cursor.execute("INSERT OR REPLACE INTO config (key, value) VALUES ('schema_version', ?)", (SCHEMA_VERSION,))
             conn.commit()
             print("Database initialized/updated with CREATE IF NOT EXISTS statements.")
         except sqlite3.Error as e:
-            print(f"Error initializing database with CREATE IF NOT EXISTS: {e}")
-        finally:
-            conn.close()
+            print(f"Error initializing database with CREATE IF NOT EXISTS: {e}"); conn.rollback()
 
     # --- User Functions ---
+    @staticmethod
+    def _hash_password(password):
+        salt = os.urandom(16)
+        digest = hashlib.scrypt(password.encode(), salt=salt, n=2**15, r=8, p=1, dklen=32, maxmem=2**26)
+        return f"scrypt${salt.hex()}${digest.hex()}"
+
+    @staticmethod
+    def _verify_password(password, stored_hash):
+        if stored_hash.startswith("scrypt$"):
+            _, salt_hex, digest_hex = stored_hash.split("$")
+            digest = hashlib.scrypt(password.encode(), salt=bytes.fromhex(salt_hex), n=2**15, r=8, p=1, dklen=32, maxmem=2**26)
+            return hmac.compare_digest(digest.hex(), digest_hex)
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored_hash) # Legacy unsalted hash
+
     def add_user(self, username, password):
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
-        res = self.execute_query("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, password_hash))
-        if res and res.lastrowid: 
-            user_id = res.lastrowid
-            default_categories = ["General", "Academic", "Personal", "Project", "Urgent"]
-            for cat_name in default_categories:
-                self.add_task_category(user_id, cat_name)
-        return res
+        password_hash = self._hash_password(password)
+        default_categories = ["General", "Academic", "Personal", "Project", "Urgent"]
+        try:
+            conn = self._get_conn()
+            with self._tx(conn): # User row and default categories share one transaction (one commit)
+                res = conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, password_hash))
+                conn.executemany("INSERT OR IGNORE INTO task_categories (user_id, name) VALUES (?, ?)",
+                                 [(res.lastrowid, cat_name) for cat_name in default_categories])
+            return res
+        except sqlite3.Error as e:
+            log.warning("Database error adding user %r: %s", username, e)
+            return None
 
     def check_user(self, username, password):
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
-        return self.fetch_one("SELECT user_id, username FROM users WHERE username = ? AND password_hash = ?", (username, password_hash))
+        row = self.fetch_one("SELECT user_id, username, password_hash FROM users WHERE username = ?", (username,))
+        if not row or not self._verify_password(password, row[2]): return None
+        if not row[2].startswith("scrypt$"): # Upgrade legacy SHA-256 hashes on successful login
+            self.execute_query("UPDATE users SET password_hash = ? WHERE user_id = ?", (self._hash_password(password), row[0]))
+        return row[:2]
 
     # --- Task Category Functions ---
     def add_task_category(self, user_id, category_name):
+        self._categories.pop(user_id, None)
         return self.execute_query("INSERT OR IGNORE INTO task_categories (user_id, name) VALUES (?, ?)", (user_id, category_name))
 
     def get_task_categories(self, user_id):
-        categories = self.fetch_all("SELECT name FROM task_categories WHERE user_id = ? ORDER BY name", (user_id,))
+        cached = self._categories.get(user_id)
+        if cached is not None: return list(cached)
+        categories = self.fetch_all("SELECT name FROM task_categories WHERE user_id = ? ORDER BY CASE WHEN name = 'General' THEN 0 ELSE 1 END, name", (user_id,))
         cat_list = [cat[0] for cat in categories] if categories else []
-        if "General" not in cat_list:
+        if not cat_list or cat_list[0] != "General":
             cat_list.insert(0, "General") 
-        elif "General" in cat_list and cat_list.index("General") != 0: 
-            cat_list.pop(cat_list.index("General"))
-            cat_list.insert(0, "General")
+        if categories is not None: self._categories[user_id] = tuple(cat_list) # Not cached when the query failed
         return cat_list
 
 
     def delete_task_category(self, user_id, category_name):
         if category_name.lower() == 'general': 
             return False 
+        self._categories.pop(user_id, None)
         self.execute_query("UPDATE tasks SET category = 'General' WHERE user_id = ? AND category = ?", (user_id, category_name))
         return self.execute_query("DELETE FROM task_categories WHERE user_id = ? AND name = ?", (user_id, category_name))
 
@@ -257,37 +377,56 @@ class DatabaseManager:
         if user_id is None:
             print("Error: user_id is None in DatabaseManager.add_task. Cannot add task.") 
             return None
-        print(f"DBManager.add_task called with user_id: {user_id}, desc: {description}, cat: {category}, due: {due_date}") 
+        log.debug("DBManager.add_task uid=%s desc=%r cat=%r due=%r", user_id, description, category, due_date)
         return self.execute_query("INSERT INTO tasks (user_id, description, category, due_date, created_at) VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)",
                                   (user_id, description, category, due_date))
 
-    def get_tasks(self, user_id, show_completed=False, category_filter=None, due_filter=None, limit=None): 
+    def get_task_stats(self, user_id):
+        """(total, completed) task counts for the user."""
+        row = self.fetch_one("SELECT COUNT(*), COALESCE(SUM(completed != 0), 0) FROM tasks WHERE user_id = ?", (user_id,))
+        return tuple(row) if row else (0, 0)
+
+    def get_tasks(self, user_id, show_completed=False, category_filter=None, due_filter=None, limit=None, display=False): 
         params = [user_id]
-        query = "SELECT task_id, description, category, due_date, completed, created_at FROM tasks WHERE user_id = ?"
+        cols = ("task_id, description, category, COALESCE(NULLIF(due_date, ''), 'N/A'), CASE WHEN completed THEN 'Completed' ELSE 'Pending' END, "
+                "COALESCE(substr(strftime('%Y-%m-%d %H:%M', created_at), 3), created_at)") if display else "task_id, description, category, due_date, completed, created_at"
+        query = f"SELECT {cols} FROM tasks WHERE user_id = ?" # display=True: Treeview-ready columns formatted by SQLite's C date functions
         if not show_completed:
             query += " AND completed = 0"
         if category_filter and category_filter != "All Categories":
             query += " AND category = ?"
             params.append(category_filter)
         
-        today_str = datetime.date.today().strftime('%Y-%m-%d')
+        today = datetime.date.today(); today_str = today.isoformat()
         if due_filter == "today":
             query += " AND due_date = ?"
             params.append(today_str)
         elif due_filter == "upcoming": 
-            next_week_str = (datetime.date.today() + datetime.timedelta(days=7)).strftime('%Y-%m-%d')
+            next_week_str = (today + datetime.timedelta(days=7)).isoformat()
             query += " AND due_date > ? AND due_date <= ?"
             params.extend([today_str, next_week_str])
         elif due_filter == "overdue":
             query += " AND due_date < ? AND completed = 0" 
             params.append(today_str)
 
-        query += " ORDER BY CASE WHEN due_date IS NULL OR due_date = '' THEN 1 ELSE 0 END, due_date ASC, created_at DESC"
-        if limit:
-            query += f" LIMIT {int(limit)}"
+        query += " ORDER BY CASE WHEN due_date IS NULL OR due_date = '' THEN 1 ELSE 0 END, due_date ASC, created_at DESC LIMIT ?"
+        params.append(int(limit) if limit else -1) # Always bound (-1 = no limit) so the SQL text doesn't vary with limit
         return self.fetch_all(query, tuple(params))
 
 
+    def get_reminder_tasks(self, user_id):
+        """Returns (due_today, overdue) pending tasks from a single query."""
+        rows = self.fetch_all(
+            "SELECT task_id, description, category, due_date, "
+            "CASE WHEN due_date = :today THEN 'today' ELSE 'overdue' END AS bucket "
+            "FROM tasks WHERE user_id = :uid AND completed = 0 AND due_date <= :today "
+            "ORDER BY bucket, due_date ASC, created_at DESC",
+            {"uid": user_id, "today": datetime.date.today().isoformat()})
+        due_today, overdue = [], []
+        for row in rows or []:
+            (due_today if row[4] == "today" else overdue).append(row)
+        return due_today, overdue
+
     def update_task_status(self, task_id, completed):
         return self.execute_query("UPDATE tasks SET completed = ? WHERE task_id = ?", (1 if completed else 0, task_id))
 
@@ -301,17 +440,24 @@ class DatabaseManager:
             (user_id, subject, start_time, duration_minutes, notes)
         )
 
-    def get_study_logs(self, user_id, limit=None): 
-        query = "SELECT log_id, subject, start_time, duration_minutes, notes FROM study_logs WHERE user_id = ? ORDER BY start_time DESC" 
-        if limit:
-            query += f" LIMIT {int(limit)}"
-        return self.fetch_all(query, (user_id,))
+    def get_study_logs(self, user_id, limit=None, display=False): # display=True: (log_id, subject, date, "N min", notes) formatted by SQLite
+        cols = "log_id, subject, COALESCE(strftime('%Y-%m-%d %H:%M', start_time), start_time), duration_minutes || ' min', notes" if display else "log_id, subject, start_time, duration_minutes, notes"
+        query = f"SELECT {cols} FROM study_logs WHERE user_id = ? ORDER BY start_time DESC LIMIT ?" 
+        return self.fetch_all(query, (user_id, int(limit) if limit else -1))
     
-    def get_study_days_count(self, user_id, days_period):
-        date_threshold = (datetime.date.today() - datetime.timedelta(days=days_period)).strftime("%Y-%m-%d %H:%M:%S")
-        query = "SELECT COUNT(DISTINCT DATE(start_time)) FROM study_logs WHERE user_id = ? AND start_time >= ?"
-        result = self.fetch_one(query, (user_id, date_threshold))
-        return result[0] if result else 0
+    def get_study_stats(self, user_id, day_periods=()):
+        """(sessions, total minutes, *days studied in each of the last `day_periods` days) in one pass over the user's logs."""
+        today = datetime.date.today(); thresholds = [(today - datetime.timedelta(days=p)).isoformat() for p in day_periods]
+        days_cols = "".join(", COUNT(DISTINCT CASE WHEN start_date >= ? THEN start_date END)" for _ in thresholds)
+        row = self.fetch_one(f"SELECT COUNT(*), COALESCE(SUM(duration_minutes), 0){days_cols} FROM study_logs WHERE user_id = ?", (*thresholds, user_id))
+        return tuple(row) if row else (0, 0) + (0,) * len(thresholds)
+
+    def get_subject_time_top(self, user_id, n=3):
+        return self.fetch_all("SELECT subject, SUM(duration_minutes) FROM study_logs WHERE user_id = ? GROUP BY subject ORDER BY 2 DESC LIMIT ?", (user_id, n)) or []
+
+    def get_study_dates(self, user_id):
+        """Distinct 'YYYY-MM-DD' days with a study session, newest first, read straight off idx_study_user_date."""
+        return tuple(row[0] for row in self.fetch_all("SELECT DISTINCT start_date FROM study_logs WHERE user_id = ? ORDER BY start_date DESC", (user_id,)) or [])
 
     # --- Quiz Attempt Functions ---
     def add_quiz_attempt(self, user_id, topic, quiz_date, score, total_questions, questions_data_json): 
@@ -320,11 +466,16 @@ class DatabaseManager:
             (user_id, topic, quiz_date, score, total_questions, questions_data_json)
         )
 
-    def get_quiz_attempts(self, user_id): 
+    def get_quiz_attempts(self, user_id, limit=None): 
         return self.fetch_all(
-            "SELECT attempt_id, topic, quiz_date, score, total_questions FROM quiz_attempts WHERE user_id = ? ORDER BY quiz_date DESC",
-            (user_id,) 
+            "SELECT attempt_id, topic, quiz_date, score, total_questions FROM quiz_attempts WHERE user_id = ? ORDER BY quiz_date DESC LIMIT ?",
+            (user_id, int(limit) if limit else -1) 
         )
+
+    def get_quiz_stats(self, user_id):
+        """(attempts, total score, total questions) for the user, summed by SQLite."""
+        row = self.fetch_one("SELECT COUNT(*), COALESCE(SUM(score), 0), COALESCE(SUM(total_questions), 0) FROM quiz_attempts WHERE user_id = ?", (user_id,))
+        return tuple(row) if row else (0, 0, 0)
     
     def get_quiz_attempt_details(self, attempt_id): 
         return self.fetch_one(
@@ -338,8 +489,9 @@ class DatabaseManager:
             (user_id, content_type, title, input_text, output_text)
         )
 
-    def get_ai_content(self, user_id, content_type=None):
-        query = "SELECT content_id, type, title, created_at FROM ai_generated_content WHERE user_id = ?"
+    def get_ai_content(self, user_id, content_type=None, display=False): # display=True: (content_id, title, type, saved) in Treeview order
+        cols = "content_id, title, type, COALESCE(strftime('%Y-%m-%d %H:%M', created_at), created_at)" if display else "content_id, type, title, created_at"
+        query = f"SELECT {cols} FROM ai_generated_content WHERE user_id = ?"
         params = [user_id]
         if content_type:
             query += " AND type = ?"
@@ -360,10 +512,50 @@ class DatabaseManager:
             (user_id, role, content)
         )
 
-    def get_chat_history(self, user_id, limit=50): # Load last N messages
-        query = "SELECT role, content, timestamp FROM ai_chat_history WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?"
-        history = self.fetch_all(query, (user_id, limit))
-        return list(reversed(history)) if history else [] # Reverse to show oldest first
+    def add_chat_messages(self, rows):
+        """Bulk insert of (user_id, role, content, timestamp) rows in one transaction."""
+        return self.executemany("INSERT INTO ai_chat_history (user_id, role, content, timestamp) VALUES (?, ?, ?, ?)", rows)
+
+    def get_chat_history(self, user_id, limit=50, display=False): # Load last N messages; display=True: timestamp as local 'HH:MM:SS'
+        ts_col = "COALESCE(time(timestamp, 'localtime'), timestamp)" if display else "timestamp" # Stored in UTC
+        query = (f"SELECT role, content, {ts_col} FROM ("
+                 "SELECT message_id, role, content, timestamp FROM ai_chat_history WHERE user_id = ? "
+                 "ORDER BY timestamp DESC, message_id DESC LIMIT ?) "
+                 "ORDER BY timestamp ASC, message_id ASC") # Oldest first; message_id orders same-second messages
+        return self.fetch_all(query, (user_id, limit)) or []
+
+    # --- AI Response Cache Functions ---
+    def get_ai_cache(self, key):
+        row = self.fetch_one("SELECT response FROM ai_cache WHERE key = ? AND created_at + ttl > ?", (key, time.time()))
+        return row[0] if row else None
+
+    def set_ai_cache(self, key, response, ttl):
+        now = time.time()
+        try:
+            conn = self._get_conn()
+            with self._tx(conn): # Sweep and insert share one transaction: one WAL commit per cache write
+                conn.execute("DELETE FROM ai_cache WHERE created_at + ttl <= ?", (now,)) # Drop expired entries as we go
+                return conn.execute("INSERT OR REPLACE INTO ai_cache (key, response, created_at, ttl) VALUES (?, ?, ?, ?)", (key, response, now, ttl))
+        except sqlite3.Error as e:
+            log.warning("AI cache write error: %s", e); return None
+
+    def get_sem_cache(self, mode, model, limit=SEM_CACHE_SCAN):
+        """(emb, response) rows for the newest unexpired similarity-cache entries of mode/model."""
+        return self.fetch_all("SELECT emb, response FROM ai_sem_cache WHERE mode = ? AND model = ? AND created_at + ttl > ? ORDER BY id DESC LIMIT ?",
+                              (mode, model, time.time(), limit)) or []
+
+    def add_sem_cache(self, mode, model, prompt, emb, response, ttl, keep=SEM_CACHE_SCAN):
+        now = time.time()
+        try:
+            conn = self._get_conn()
+            with self._tx(conn): # Insert, expiry sweep and trim to the scan window share one transaction
+                conn.execute("INSERT INTO ai_sem_cache (mode, model, prompt, emb, response, created_at, ttl) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (mode, model, prompt, emb, response, now, ttl))
+                conn.execute("DELETE FROM ai_sem_cache WHERE created_at + ttl <= ? OR id IN (SELECT id FROM ai_sem_cache WHERE mode = ? AND model = ? ORDER BY id DESC LIMIT -1 OFFSET ?)",
+                             (now, mode, model, keep)) # Rows past the scan window can never match again
+                return True
+        except sqlite3.Error as e:
+            log.warning("AI similarity cache write error: %s", e); return None
 
     # --- Config Functions ---
     def get_config_value(self, key):
@@ -374,6 +566,125 @@ class DatabaseManager:
         return self.execute_query("INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)", (key, value))
 
 
+# --- Background DB Worker ---
+class DBWorker(threading.Thread):
+    """Runs DatabaseManager calls in order on one background thread (which gets its own connection)
+    and hands each result to its callback on the Tk thread."""
+    BATCH = 32 # Most jobs per transaction
+    def __init__(self, controller):
+        super().__init__(daemon=True); self.controller = controller; self.jobs = queue.Queue(); self.closing = False
+
+    def submit(self, fn, *args, callback=None):
+        self.jobs.put((fn, args, callback))
+
+    def stop(self, timeout=5):
+        """Finishes queued jobs (without callbacks) and stops the thread."""
+        self.closing = True; self.jobs.put(None); self.join(timeout)
+
+    def run(self):
+        db = self.controller.db_manager; stop = False
+        while not stop:
+            jobs = [self.jobs.get()] # Block for one job, then take whatever else is already queued (up to BATCH)
+            while len(jobs) < self.BATCH:
+                try: jobs.append(self.jobs.get_nowait())
+                except queue.Empty: break
+            if None in jobs: stop = True; jobs = jobs[:jobs.index(None)]
+            done = []
+            try:
+                with db.batch(): # One commit for the whole drain instead of one per write
+                    for fn, args, callback in jobs:
+                        try: result = fn(*args)
+                        except Exception: log.exception("DB worker error in %s", getattr(fn, '__name__', fn)); result = None
+                        done.append((callback, result))
+            except sqlite3.Error as e: log.warning("DB worker batch error: %s", e); done = [(cb, None) for fn, args, cb in jobs] # Rolled back (or never begun): every job failed
+            for callback, result in done: # Only after the commit, so callbacks (and the Tk thread's connection) see the writes
+                if callback and not self.closing:
+                    try: self.controller.after(0, callback, result)
+                    except (RuntimeError, tk.TclError): pass # Window already destroyed
+
+
+def prompt_key(text):
+    """Cache identity for an AI Helper input: casefolded with whitespace runs collapsed, so 'Explain  Photosynthesis'
+    and 'explain photosynthesis' share one cached answer. Punctuation and symbols stay: 'C++' and 'C#' must not collide."""
+    return " ".join(text.casefold().split())
+
+def pack_embedding(values):
+    """Unit-length float16 blob for an embedding, so cosine similarity is a plain dot product (768 values -> 1.5 KiB)."""
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return struct.pack(f"<{len(values)}e", *(v / norm for v in values))
+
+def best_match(emb, rows):
+    """(similarity, response) of the get_sem_cache row closest to the packed embedding `emb`, or (0.0, None)."""
+    q = struct.unpack(f"<{len(emb) // 2}e", emb); best = (0.0, None)
+    for blob, response in rows:
+        if len(blob) != len(emb): continue # Stored under another embedding size
+        sim = sum(map(operator.mul, q, struct.unpack(f"<{len(blob) // 2}e", blob)))
+        if sim > best[0]: best = (sim, response)
+    return best
+
+@functools.lru_cache(maxsize=32)
+def study_streak(days, today):
+    """Consecutive study days ending today (or yesterday, if today has no log yet). `days` is a tuple of distinct
+    'YYYY-MM-DD' strings, newest first, and `today` a date ordinal, so an unchanged log set on the same day is a cache hit."""
+    streak = 0; expect = None
+    for d in days: # Run-length scan over integer ordinals; stops at the first gap, so only streak+1 days are parsed
+        try: o = datetime.date(int(d[:4]), int(d[5:7]), int(d[8:10])).toordinal()
+        except (TypeError, ValueError): continue
+        if o > today: continue # Future-dated log
+        if expect is None:
+            if o < today - 1: return 0
+            expect = o
+        if o != expect: break
+        streak += 1; expect -= 1
+    return streak
+
+@functools.lru_cache(maxsize=16)
+def gemini_url(model, method):
+    return f"{GEMINI_API_BASE}/{model}:{method}" # Built once per model/method pair; no key in it
+
+def study_log_rows(db_manager, user_id, limit=None, with_iid=True):
+    """Study log Treeview rows ready for populate_tree; called on the DB worker."""
+    return [(str(row[0]) if with_iid else None, row[1:]) for row in db_manager.get_study_logs(user_id, limit, display=True) or []]
+
+class TreeWindow:
+    """Shows a sliding `size`-row slice of a long (iid, values) list in a Treeview; the scrollbar still spans the whole list.
+    Lists that fit in one window are inserted in full. Rows are keyed by iid so selection survives window shifts."""
+    def __init__(self, controller, tree, scrollbar, size=100):
+        self.controller, self.tree, self.sb, self.size = controller, tree, scrollbar, size
+        self.rows = []; self.start = 0; self._shift_id = None
+        tree.configure(yscrollcommand=self._on_tree_scroll); scrollbar.configure(command=self._on_scrollbar)
+
+    def set_rows(self, rows):
+        self.rows = rows = rows or []; self.start = 0 # None: the DB worker job failed
+        if self._shift_id is not None: self.tree.after_cancel(self._shift_id); self._shift_id = None
+        if len(rows) <= self.size: self.controller.populate_tree(self.tree, rows); return
+        self.tree.delete(*self.tree.get_children()); self._render(); self.tree.yview_moveto(0)
+
+    def _render(self): # Diff the window: drop rows that left it, insert the ones that entered at their position
+        tree = self.tree; rows = self.rows[self.start:self.start + self.size]; want = {iid for iid, _ in rows}
+        gone = [iid for iid in tree.get_children() if iid not in want]
+        if gone: tree.delete(*gone)
+        have = set(tree.get_children())
+        for idx, (iid, values) in enumerate(rows):
+            if iid not in have: tree.insert("", idx, iid=iid, values=values)
+
+    def _move_to(self, top): # top = fractional index into self.rows of the first visible row
+        self._shift_id = None; n = len(self.rows)
+        new_start = max(0, min(int(top) - self.size // 4, n - self.size))
+        if new_start != self.start: self.start = new_start; self._render()
+        self.tree.yview_moveto((top - self.start) / self.size)
+
+    def _on_tree_scroll(self, first, last):
+        first, last = float(first), float(last); n = len(self.rows)
+        if n <= self.size: self.sb.set(first, last); return
+        top = self.start + first * self.size; self.sb.set(top / n, (self.start + last * self.size) / n)
+        at_edge = (first <= 0 and self.start > 0) or (last >= 1 and self.start + self.size < n)
+        if at_edge and self._shift_id is None: self._shift_id = self.tree.after_idle(self._move_to, top) # Not from inside Tk's redraw
+
+    def _on_scrollbar(self, *args): # Drags jump the window; unit/page steps scroll inside it and shift at the edges
+        if len(self.rows) <= self.size or args[0] != "moveto": return self.tree.yview(*args)
+        self._move_to(float(args[1]) * len(self.rows))
+
 # --- Main Application ---
 class AIStudyAssistant(tk.Tk):
     def __init__(self, db_manager):
@@ -385,8 +696,19 @@ class AIStudyAssistant(tk.Tk):
 
         self.current_user_id = None
         self.current_username = None
+        self.current_frame_name = None
         self.pomodoro_work_duration = tk.IntVar(value=25) 
         self.pomodoro_break_duration = tk.IntVar(value=5)  
+        self._dur_s_by_state = {} # Pomodoro phase lengths in seconds, kept in sync with the IntVars by write traces
+        for state, var in (("work", self.pomodoro_work_duration), ("break", self.pomodoro_break_duration)):
+            var.trace_add("write", lambda *_, s=state, v=var: self._sync_duration(s, v)); self._sync_duration(state, var)
+        self.load_gemini_api_key() # Cached for the session; SettingsFrame refreshes it on save
+        self._quote_cache = None # (date, quote text) for MainPage, see fetch_motivational_quote
+        self.data_version = {"tasks": 0, "logs": 0, "ai": 0, "quiz": 0} # Bumped by mutations, see needs_reload
+        self._http = None; self._http_lock = threading.Lock() # Shared keep-alive session, see http_session()
+        self.start_workers()
+        self._pending_chats = []; self._pending_chats_lock = threading.Lock(); self._chat_flush_id = None # Write-behind chat queue
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
 
         style = ttk.Style(self)
         style.theme_use("clam") 
@@ -410,30 +732,136 @@ class AIStudyAssistant(tk.Tk):
         style.configure("Link.TLabel", foreground="blue", font=("Arial", 10, "underline"), background=self.main_bg_color)
         style.configure("UserChat.TLabel", background="#d1e7dd", foreground="black", padding=5, relief="solid", borderwidth=1, font=("Arial",10)) 
         style.configure("AssistantChat.TLabel", background="#f8f9fa", foreground="black", padding=5, relief="solid", borderwidth=1, font=("Arial",10)) 
+        style.configure("Reminder.TLabel", background=self.main_bg_color, font=("Arial", 10)); style.configure("ReminderHeader.TLabel", background=self.main_bg_color, font=("Arial", 12, "bold")) # Used by ReminderPopup
 
 
         self.container = ttk.Frame(self, padding=15); self.container.pack(fill=tk.BOTH, expand=True)
         self.status_bar = ttk.Label(self, text="Welcome!", style="Status.TLabel", anchor=tk.W)
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
-        self.frames = {}
+        self._status_expiry = None; self._tick_status() # One rolling timer clears expired status messages
+        self.frames = {} # Built lazily by _get_frame on first visit
         # Removed DailyPlanFrame from this list
-        for F in (LoginPage, RegisterPage, MainPage, TaskManagerFrame, StudyTrackerFrame, 
+        self._frame_classes = {F.__name__: F for F in (LoginPage, RegisterPage, MainPage, TaskManagerFrame, StudyTrackerFrame, 
                     QuizFrame, AnalyticsFrame, AIHelperFrame, SettingsFrame, 
-                    ReviewHubFrame, GeminiChatFrame): 
-            page_name = F.__name__; frame = F(parent=self.container, controller=self)
-            self.frames[page_name] = frame; frame.grid(row=0, column=0, sticky="nsew")
+                    ReviewHubFrame, GeminiChatFrame)}
         self.show_frame("LoginPage") 
 
+    def _sync_duration(self, state, var):
+        try: self._dur_s_by_state[state] = var.get() * 60
+        except tk.TclError: pass # Half-typed Spinbox text: keep the last valid value
+
+    def load_gemini_api_key(self): # Also loads the model override, which lives next to the key in config
+        self.gemini_api_key = GEMINI_API_KEY or self.db_manager.get_config_value('GEMINI_API_KEY') or ""
+        self.gemini_model = self.db_manager.get_config_value('GEMINI_MODEL') or "" # "" = per-task default from MODEL_FOR_MODE
+
+    def model_for(self, mode):
+        return self.gemini_model or MODEL_FOR_MODE.get(mode, GEMINI_MODELS[0])
+
+    def http_session(self):
+        """Returns the shared requests.Session (created on first use) so Gemini calls reuse pooled TLS connections."""
+        with self._http_lock:
+            if self._http is None:
+                import requests; from requests.adapters import HTTPAdapter; from urllib3.util.retry import Retry
+                http = requests.Session(); http.headers.update({'Content-Type': 'application/json; charset=utf-8'}) # Responses already come gzip'd: requests sends Accept-Encoding (br too when brotli is installed)
+                retry_kw = dict(total=2, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False)
+                try: retry = Retry(allowed_methods=None, **retry_kw) # None = any verb: generateContent POSTs have no side effects
+                except TypeError: retry = Retry(method_whitelist=None, **retry_kw) # urllib3 < 1.26
+                http.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry))
+                self._http = http
+            return self._http
+
+    def gemini_post(self, model, method, payload, timeout, **kw):
+        """POSTs payload to model:method on the shared session. The key travels in the x-goog-api-key header, so URLs
+        (cached per model/method) carry no secret and never show up in logged request lines or tracebacks."""
+        return self.http_session().post(gemini_url(model, method), data=json_compact(payload).encode(), # Compact body: no separator padding, UTF-8 not \u escapes
+                                        headers={"x-goog-api-key": self.gemini_api_key}, timeout=timeout, **kw)
+
+    def submit_ai(self, fn, *args, callback=None):
+        """Runs fn(*args) on ai_pool; callback(future) then runs on the Tk thread, like DBWorker.submit."""
+        fut = self.ai_pool.submit(fn, *args)
+        if callback: fut.add_done_callback(lambda f: self.after(0, callback, f))
+        return fut
+
+    def gemini_call(self, payload, timeout=90, ttl=86400, cache_seed=None, mode=None):
+        """POSTs a generateContent payload, answering repeats from the ai_cache table for `ttl` seconds.
+        `cache_seed` replaces the payload as the cache identity (e.g. a normalized topic or today's date). ttl=0 bypasses the cache."""
+        seed = payload if cache_seed is None else cache_seed; model = self.model_for(mode)
+        key = self._ai_cache_key(seed, model) if ttl else None; cached = key and self.db_manager.get_ai_cache(key)
+        if cached: return json.loads(cached)
+        r = self.gemini_post(model, "generateContent", payload, timeout); r.raise_for_status()
+        body = r.content; res = json.loads(body) # Bytes straight to json: skips requests' text decoding and encoding sniffing
+        if key and res.get("candidates"): self.db_manager.set_ai_cache(key, body.decode("utf-8"), ttl) # Only cache usable answers; stored as received, no re-dump
+        return res
+
+    @staticmethod
+    def _ai_cache_key(seed, model): return hashlib.sha256(json.dumps(seed, sort_keys=True).encode() + model.encode()).hexdigest()
+
+    def embed_text(self, text, timeout=15):
+        """Packed SEM_CACHE_MODEL embedding of text (see pack_embedding), or None if the embedding call fails."""
+        try:
+            r = self.gemini_post(SEM_CACHE_MODEL, "embedContent", {"model": f"models/{SEM_CACHE_MODEL}", "content": {"parts": [{"text": text}]}}, timeout)
+            r.raise_for_status(); values = json.loads(r.content).get("embedding", {}).get("values")
+            return pack_embedding(values) if values else None
+        except Exception as e: log.warning("Embedding failed, similarity cache skipped: %s", e); return None
+
+    def gemini_stream(self, payload, on_chunk, timeout=90, ttl=86400, cache_seed=None, mode=None, similar=None):
+        """Like gemini_call, but reads streamGenerateContent's SSE frames and passes each text piece to on_chunk
+        (on this worker thread) as it arrives. Returns the full text; a cache hit arrives as one piece. ttl=0 bypasses the cache.
+        `similar` (the user's prompt) adds a second lookup on an exact-cache miss: an answer cached for a prompt whose
+        embedding is at least SEM_CACHE_THRESHOLD cosine-similar is reused, so rewordings share one answer."""
+        seed = payload if cache_seed is None else cache_seed; model = self.model_for(mode)
+        key = self._ai_cache_key(seed, model) if ttl else None; cached = key and self.db_manager.get_ai_cache(key)
+        emb = None
+        if not cached and key and similar:
+            emb = self.embed_text(similar)
+            if emb:
+                sim, cached = best_match(emb, self.db_manager.get_sem_cache(mode, model))
+                if sim < SEM_CACHE_THRESHOLD: cached = None
+                else: log.debug("Similarity cache hit (%.3f) for %r", sim, similar)
+        if cached:
+            parts = json.loads(cached).get("candidates", [{}])[0].get("content", {}).get("parts", [])
+            text = "".join(p.get("text", "") for p in parts); on_chunk(text); return text
+        pieces = []
+        with self.gemini_post(model, "streamGenerateContent?alt=sse", payload, timeout, stream=True) as r:
+            if r.status_code >= 400: r.content # Buffer the error body while the stream is open, so handlers can still read err.response.json()
+            r.raise_for_status()
+            for line in r.iter_lines(): # Bytes; the SSE stream may not declare a charset
+                if not line.startswith(b"data:"): continue
+                for part in json.loads(line[5:]).get("candidates", [{}])[0].get("content", {}).get("parts", []):
+                    if part.get("text"): pieces.append(part["text"]); on_chunk(part["text"])
+        text = "".join(pieces)
+        if text and key:
+            blob = json.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]}) # Same shape gemini_call caches
+            self.db_manager.set_ai_cache(key, blob, ttl)
+            if emb: self.db_manager.add_sem_cache(mode, model, similar, emb, blob, ttl)
+        return text
+
+    def _get_frame(self, page_name):
+        frame = self.frames.get(page_name)
+        if frame is None and page_name in self._frame_classes:
+            frame = self._frame_classes[page_name](parent=self.container, controller=self)
+            self.frames[page_name] = frame; frame.grid(row=0, column=0, sticky="nsew")
+        return frame
+
     def show_frame(self, page_name, status_message=None): 
         if self.current_user_id is None and page_name not in ["LoginPage", "RegisterPage"]:
             messagebox.showinfo("Login Required", "Please log in."); self.show_frame("LoginPage"); return
-        frame = self.frames.get(page_name)
+        frame = self._get_frame(page_name)
         if frame:
-            frame.tkraise(); 
+            frame.tkraise(); self.current_frame_name = page_name
             if hasattr(frame, 'refresh_data'): frame.refresh_data()
             if status_message: self.update_status(status_message)
         else: print(f"Error: Frame '{page_name}' not found."); self.update_status(f"Error loading page.", 5000)
 
+    def mark_dirty(self, *domains): # No args: everything (e.g. after a restore)
+        for d in domains or tuple(self.data_version): self.data_version[d] += 1
+
+    def needs_reload(self, frame, domain):
+        """True, and recorded as shown, unless `frame` already displays this user's current `domain` data."""
+        stamp = (self.current_user_id, self.data_version[domain]); seen = frame.__dict__.setdefault("_seen", {})
+        if seen.get(domain) == stamp: return False
+        seen[domain] = stamp; return True
+
     def login_user(self, user_id, username): 
         self.current_user_id = user_id; self.current_username = username
         self.show_frame("MainPage", status_message=f"Logged in as {username}")
@@ -441,15 +869,62 @@ class AIStudyAssistant(tk.Tk):
              self.frames["MainPage"].update_welcome_message(); self.frames["MainPage"].fetch_motivational_quote() 
 
     def logout_user(self): 
+        self.flush_chats(False)
         self.current_user_id = None; self.current_username = None
         self.show_frame("LoginPage", status_message="Successfully logged out.")
 
-    def update_status(self, message, duration=5000): 
+    def start_workers(self):
+        self.db_worker = DBWorker(self); self.db_worker.start() # Keeps slow DB reads/writes off the Tk loop
+        self.ai_pool = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="gemini") # Matches the session's pool_maxsize
+
+    def pause_workers(self, on_idle):
+        """Stops the DB worker and AI pool, then calls on_idle on the Tk thread once every queued DB job and AI request
+        has finished, so no other thread holds a connection. The wait runs on a helper thread: pool threads post back to
+        Tk with after(), so blocking the Tk loop here could deadlock. Call start_workers() afterwards."""
+        pool, worker = self.ai_pool, self.db_worker
+        pool.shutdown(wait=False); worker.stop(timeout=0) # Queue the stop; the helper does the waiting
+        def wait_idle(): pool.shutdown(wait=True); worker.join(); self.after(0, on_idle)
+        threading.Thread(target=wait_idle, daemon=True).start()
+
+    def on_close(self):
+        self.flush_chats(); self.ai_pool.shutdown(wait=False); self.db_worker.stop(); self.destroy()
+
+    def queue_chat_message(self, user_id, role, content):
+        """Buffers a chat message; buffered messages are written in one transaction about a second later. Safe from any thread."""
+        ts = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S") # Same format as CURRENT_TIMESTAMP
+        with self._pending_chats_lock: self._pending_chats.append((user_id, role, content, ts)) # Only the append is locked: no Tk calls under it
+        if threading.current_thread() is threading.main_thread(): self._schedule_chat_flush()
+        else:
+            try: self.after(0, self._schedule_chat_flush) # Timer bookkeeping stays on the Tk thread
+            except (RuntimeError, tk.TclError): pass # Closing; on_close flushes what is buffered
+
+    def _schedule_chat_flush(self): # Tk thread only, like every use of _chat_flush_id
+        if self._chat_flush_id is None: self._chat_flush_id = self.after(1000, self.flush_chats, False)
+
+    def flush_chats(self, wait=True):
+        """Writes buffered chat messages in one transaction: here, or with wait=False on the DB worker (where it may share a commit with other queued writes). Tk thread only."""
+        with self._pending_chats_lock: rows, self._pending_chats = self._pending_chats, []
+        if self._chat_flush_id is not None: self.after_cancel(self._chat_flush_id); self._chat_flush_id = None
+        if not rows: return
+        if wait: self.db_manager.add_chat_messages(rows)
+        else: self.db_worker.submit(self.db_manager.add_chat_messages, rows)
+
+    def populate_tree(self, tree, rows):
+        """Replaces a Treeview's rows with (iid, values) pairs: one bulk delete, then inserts with the columns detached so Tk lays out once."""
+        shown = tree.cget("displaycolumns"); tree.configure(displaycolumns=())
+        try:
+            tree.delete(*tree.get_children()); insert = tree.insert
+            for iid, values in rows or (): insert("", tk.END, iid=iid, values=values) # None (failed worker job) clears the tree
+        finally: tree.configure(displaycolumns=shown)
+
+    def update_status(self, message, duration=5000): # duration <= 0 keeps the message until replaced
         self.status_bar.config(text=message)
-        if duration > 0 and hasattr(self.status_bar, '_after_id') and self.status_bar._after_id:
-            self.status_bar.after_cancel(self.status_bar._after_id)
-        if duration > 0: self.status_bar._after_id = self.status_bar.after(duration, lambda: self.status_bar.config(text="")) 
-        else: self.status_bar._after_id = None
+        self._status_expiry = time.monotonic() + duration / 1000 if duration > 0 else None
+
+    def _tick_status(self):
+        if self._status_expiry is not None and time.monotonic() >= self._status_expiry:
+            self.status_bar.config(text=""); self._status_expiry = None
+        self.after(200, self._tick_status)
 
 
 # --- Frames (UI Pages) ---
@@ -462,12 +937,16 @@ class LoginPage(ttk.Frame):
         ttk.Label(center_frame, text="Password:").pack(pady=(10,0))
         self.password_entry = ttk.Entry(center_frame, show="*", width=30, font=("Arial", 11)); self.password_entry.pack(ipady=4, pady=2)
         self.password_entry.bind("<Return>", lambda event: self.login()) 
-        ttk.Button(center_frame, text="Login", command=self.login).pack(pady=20, ipadx=10, ipady=4)
+        self.login_button = ttk.Button(center_frame, text="Login", command=self.login); self.login_button.pack(pady=20, ipadx=10, ipady=4)
         ttk.Button(center_frame, text="Register", command=lambda: controller.show_frame("RegisterPage")).pack(ipadx=5, ipady=4)
     def login(self):
+        if self.login_button.instate(["disabled"]): return # A check is already running
         username = self.username_entry.get().strip(); password = self.password_entry.get() 
         if not username or not password: messagebox.showerror("Error", "Username/password empty."); self.controller.update_status("Login failed: fields empty.", 3000); return
-        user = self.controller.db_manager.check_user(username, password)
+        self.login_button.config(state=tk.DISABLED); self.controller.update_status("Logging in...", 0)
+        self.controller.db_worker.submit(self.controller.db_manager.check_user, username, password, callback=self._login_finished) # Hashing + lookup off the Tk loop, on the worker's long-lived connection
+    def _login_finished(self, user):
+        self.login_button.config(state=tk.NORMAL)
         if user: self.controller.login_user(user[0], user[1]); self.username_entry.delete(0, tk.END); self.password_entry.delete(0, tk.END)
         else: messagebox.showerror("Login Failed", "Invalid credentials."); self.controller.update_status("Login failed: invalid credentials.", 3000)
     def refresh_data(self): self.controller.update_status("Please log in or register.")
@@ -483,15 +962,23 @@ class RegisterPage(ttk.Frame):
         ttk.Label(center_frame, text="Confirm Password:").pack(pady=(10,0))
         self.confirm_password_entry = ttk.Entry(center_frame, show="*", width=30, font=("Arial", 11)); self.confirm_password_entry.pack(ipady=4, pady=2)
         self.confirm_password_entry.bind("<Return>", lambda event: self.register()) 
-        ttk.Button(center_frame, text="Register", command=self.register).pack(pady=20, ipadx=10, ipady=4)
+        self.register_button = ttk.Button(center_frame, text="Register", command=self.register); self.register_button.pack(pady=20, ipadx=10, ipady=4)
         ttk.Button(center_frame, text="Back to Login", command=lambda: controller.show_frame("LoginPage")).pack(ipadx=5, ipady=4)
     def register(self):
+        if self.register_button.instate(["disabled"]): return # Registration already in progress
         username = self.username_entry.get().strip(); password = self.password_entry.get(); confirm_password = self.confirm_password_entry.get() 
         if not username or not password or not confirm_password: messagebox.showerror("Error", "All fields required."); return
         if len(password) < 6: messagebox.showerror("Error", "Password min 6 chars."); return
         if password != confirm_password: messagebox.showerror("Error", "Passwords do not match."); return
-        if self.controller.db_manager.fetch_one("SELECT user_id FROM users WHERE username = ?", (username,)): messagebox.showerror("Error", "Username exists."); return
-        if self.controller.db_manager.add_user(username, password): 
+        self.register_button.config(state=tk.DISABLED); self.controller.update_status("Registering...", 0)
+        self.controller.db_worker.submit(self._create_account, username, password, callback=lambda result: self._register_finished(username, result))
+    def _create_account(self, username, password): # DB worker: hashing + DB writes stay off the Tk loop
+        if self.controller.db_manager.fetch_one("SELECT user_id FROM users WHERE username = ?", (username,)): return "exists"
+        return "ok" if self.controller.db_manager.add_user(username, password) else "failed"
+    def _register_finished(self, username, result):
+        self.register_button.config(state=tk.NORMAL)
+        if result == "exists": messagebox.showerror("Error", "Username exists."); self.controller.update_status("Registration failed: username exists.", 3000); return
+        if result == "ok": 
             self.controller.update_status(f"User '{username}' registered. Please log in.", 5000)
             self.username_entry.delete(0, tk.END); self.password_entry.delete(0, tk.END); self.confirm_password_entry.delete(0, tk.END)
             self.controller.show_frame("LoginPage") 
@@ -538,14 +1025,14 @@ class MainPage(ttk.Frame):
 
     def check_reminders(self): 
         if not self.controller.current_user_id: return
-        today = datetime.date.today().strftime("%Y-%m-%d")
-        due_today = self.controller.db_manager.get_tasks(self.controller.current_user_id, False, due_filter="today")
-        overdue = self.controller.db_manager.get_tasks(self.controller.current_user_id, False, due_filter="overdue")
+        due_today, overdue = self.controller.db_manager.get_reminder_tasks(self.controller.current_user_id)
         msg = ""
-        if due_today: msg += "Tasks due TODAY:\n"; [msg := msg + f"- {t[1]} ({t[2]})\n" for t in due_today[:3]]; 
-        if len(due_today) > 3: msg += f"...and {len(due_today)-3} more.\n"
-        if overdue: msg += "\nOVERDUE Tasks:\n"; [msg := msg + f"- {t[1]} (Due: {t[3]})\n" for t in overdue[:3]]; 
-        if len(overdue) > 3: msg += f"...and {len(overdue)-3} more.\n"
+        if due_today:
+            msg += "Tasks due TODAY:\n" + "".join(f"- {t[1]} ({t[2]})\n" for t in due_today[:3])
+            if len(due_today) > 3: msg += f"...and {len(due_today)-3} more.\n"
+        if overdue:
+            msg += "\nOVERDUE Tasks:\n" + "".join(f"- {t[1]} (Due: {t[3]})\n" for t in overdue[:3])
+            if len(overdue) > 3: msg += f"...and {len(overdue)-3} more.\n"
         if not msg: messagebox.showinfo("Reminders", "No urgent tasks."); self.controller.update_status("No urgent reminders.", 3000)
         else: ReminderPopup(self.controller, "Study Reminders", msg); self.controller.update_status("Reminders checked.", 3000)
 
@@ -554,22 +1041,24 @@ class MainPage(ttk.Frame):
         else: self.welcome_label.config(text="Welcome!") 
     
     def fetch_motivational_quote(self): 
+        cached = self.controller._quote_cache # (date, text): later visits today skip the pool, DB cache and JSON entirely
+        if cached and cached[0] == datetime.date.today(): self.quote_label.config(text=cached[1], style="Success.TLabel"); return
         self.quote_label.config(text="Fetching inspiration...", style="Placeholder.TLabel")
-        threading.Thread(target=self._get_ai_quote, daemon=True).start()
+        self.controller.ai_pool.submit(self._get_ai_quote)
 
     def _get_ai_quote(self): 
-        api_key = GEMINI_API_KEY or self.controller.db_manager.get_config_value('GEMINI_API_KEY') or ""
+        api_key = self.controller.gemini_api_key
         if not api_key: self.controller.after(0, lambda: self.quote_label.config(text="API key missing.", style="Error.TLabel")); return
         prompt = "A short, unique, inspiring motivational quote for a student. Concise."
         payload = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
         try:
-            import requests; r=requests.post(url, headers={'Content-Type':'application/json'},json=payload,timeout=20); r.raise_for_status(); res=r.json()
+            res=self.controller.gemini_call(payload,timeout=20,cache_seed=["quote",datetime.date.today().isoformat()],mode="quote") # New quote daily, not per launch
             if res.get("candidates") and res["candidates"][0].get("content",{}).get("parts"):
-                quote = res["candidates"][0]["content"]["parts"][0].get("text", "Keep learning!").strip()
-                self.controller.after(0, lambda: self.quote_label.config(text=f"\"{quote}\"", style="Success.TLabel"))
+                quote = f"\"{res['candidates'][0]['content']['parts'][0].get('text', 'Keep learning!').strip()}\""
+                self.controller._quote_cache = (datetime.date.today(), quote)
+                self.controller.after(0, lambda: self.quote_label.config(text=quote, style="Success.TLabel"))
             else: self.controller.after(0, lambda: self.quote_label.config(text="Stay focused!", style="Success.TLabel"))
-        except Exception as e: print(f"Quote error: {e}"); self.controller.after(0, lambda: self.quote_label.config(text="Keep going!", style="Success.TLabel"))
+        except Exception as e: log.warning("Quote error: %s", e); self.controller.after(0, lambda: self.quote_label.config(text="Keep going!", style="Success.TLabel"))
 
     def refresh_data(self): 
         self.update_welcome_message(); self.fetch_motivational_quote() 
@@ -580,8 +1069,7 @@ class MainPage(ttk.Frame):
 class ReminderPopup(tk.Toplevel): 
     def __init__(self, controller, title, message):
         super().__init__(controller); self.title(title); self.geometry("400x300")
-        bg = getattr(controller, 'main_bg_color', "#f4f6f8"); self.configure(bg=bg); self.transient(controller); self.grab_set() 
-        style = ttk.Style(self); style.configure("Reminder.TLabel", background=bg, font=("Arial", 10)); style.configure("ReminderHeader.TLabel", background=bg, font=("Arial", 12, "bold"))
+        bg = controller.main_bg_color; self.configure(bg=bg); self.transient(controller); self.grab_set() # Reminder styles are registered once by the controller
         ttk.Label(self, text=title, style="ReminderHeader.TLabel").pack(pady=10)
         txt_area = scrolledtext.ScrolledText(self, wrap=tk.WORD, height=10, width=45, font=("Arial", 10), bg=bg); txt_area.insert(tk.END, message)
         txt_area.config(state=tk.DISABLED); txt_area.pack(pady=10, padx=10, fill=tk.BOTH, expand=True)
@@ -598,12 +1086,13 @@ class ReminderPopup(tk.Toplevel):
 # --- Review Hub Frame (New) ---
 class ReviewHubFrame(ttk.Frame): 
     def __init__(self, parent, controller):
-        super().__init__(parent); self.controller = controller
+        super().__init__(parent); self.controller = controller; self.rev_logs_tree = None
         ttk.Label(self, text="Review Hub", style="Header.TLabel").pack(pady=10)
-        nb = ttk.Notebook(self); nb.pack(pady=10, padx=20, fill=tk.BOTH, expand=True)
+        self.nb = nb = ttk.Notebook(self); nb.pack(pady=10, padx=20, fill=tk.BOTH, expand=True)
         self.ai_tab = ttk.Frame(nb); self.logs_tab = ttk.Frame(nb)
         nb.add(self.ai_tab, text='Saved AI Content'); nb.add(self.logs_tab, text='Study Logs Review')
-        self._setup_saved_ai_tab(); self._setup_study_logs_tab()
+        self._setup_saved_ai_tab() # Study logs tab widgets are built the first time that tab is opened
+        nb.bind("<<NotebookTabChanged>>", lambda e: self._load_current_tab())
         ttk.Button(self, text="Back to Main Menu", command=lambda: controller.show_frame("MainPage")).pack(pady=10, side=tk.BOTTOM)
     def _setup_saved_ai_tab(self): 
         ttk.Label(self.ai_tab, text="Saved AI Explanations, Summaries & Questions", style="SubHeader.TLabel").pack(pady=10)
@@ -613,7 +1102,7 @@ class ReviewHubFrame(ttk.Frame):
         self.ai_tree.heading("Type", text="Type"); self.ai_tree.column("Type", width=100, anchor=tk.CENTER)
         self.ai_tree.heading("Created", text="Saved On"); self.ai_tree.column("Created", width=150, anchor=tk.CENTER)
         self.ai_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        sb = ttk.Scrollbar(lf, orient=tk.VERTICAL, command=self.ai_tree.yview); self.ai_tree.configure(yscroll=sb.set); sb.pack(side=tk.RIGHT, fill=tk.Y)
+        sb = ttk.Scrollbar(lf, orient=tk.VERTICAL); sb.pack(side=tk.RIGHT, fill=tk.Y); self.ai_window = TreeWindow(self.controller, self.ai_tree, sb)
         self.ai_tree.bind("<<TreeviewSelect>>", self.display_selected_ai_content)
         btns = ttk.Frame(self.ai_tab); btns.pack(pady=5)
         ttk.Button(btns, text="Delete Selected", command=self.delete_selected_ai_content, style="Danger.TButton").pack(side=tk.LEFT, padx=5)
@@ -626,60 +1115,57 @@ class ReviewHubFrame(ttk.Frame):
         self.rev_logs_tree.column("Subject", width=200); self.rev_logs_tree.column("Date", width=120, anchor=tk.CENTER)
         self.rev_logs_tree.column("Duration", width=100, anchor=tk.CENTER); self.rev_logs_tree.column("Notes", width=300)
         self.rev_logs_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, pady=5)
-        sb_l = ttk.Scrollbar(self.logs_tab, orient=tk.VERTICAL, command=self.rev_logs_tree.yview)
-        self.rev_logs_tree.configure(yscroll=sb_l.set); sb_l.pack(side=tk.RIGHT, fill=tk.Y)
+        sb_l = ttk.Scrollbar(self.logs_tab, orient=tk.VERTICAL); sb_l.pack(side=tk.RIGHT, fill=tk.Y)
+        self.logs_window = TreeWindow(self.controller, self.rev_logs_tree, sb_l)
     def refresh_data(self): 
         if not self.controller.current_user_id: self.controller.show_frame("LoginPage"); return
-        self._load_saved_ai_content(); self._load_study_logs_for_review(); self.controller.update_status("Review Hub loaded.")
+        self._load_current_tab(); self.controller.update_status("Review Hub loaded.")
+    def _load_current_tab(self): # Only the visible tab is queried; the other loads when selected
+        if not self.controller.current_user_id: return
+        if self.nb.index("current") == 0:
+            if self.controller.needs_reload(self, "ai"): self._load_saved_ai_content()
+            return
+        if self.rev_logs_tree is None: self._setup_study_logs_tab()
+        if self.controller.needs_reload(self, "logs"): self._load_study_logs_for_review()
     def _load_saved_ai_content(self): 
-        for i in self.ai_tree.get_children(): self.ai_tree.delete(i)
+        self._details = {} # content_id -> detail row, so reselecting an item doesn't hit the DB
         self.ai_disp.config(state=tk.NORMAL); self.ai_disp.delete("1.0",tk.END); self.ai_disp.config(state=tk.DISABLED)
-        items = self.controller.db_manager.get_ai_content(self.controller.current_user_id)
-        if items:
-            for item in items: 
-                cr_s = item[3]
-                try: cr_dt_obj = datetime.datetime.strptime(cr_s, "%Y-%m-%d %H:%M:%S.%f") if '.' in cr_s else datetime.datetime.strptime(cr_s, "%Y-%m-%d %H:%M:%S"); cr_d = cr_dt_obj.strftime("%Y-%m-%d %H:%M")
-                except ValueError: cr_d = cr_s
-                self.ai_tree.insert("",tk.END,values=(item[2],item[1],cr_d),iid=str(item[0]))
+        self.controller.db_worker.submit(self._saved_ai_rows, self.controller.current_user_id, callback=self.ai_window.set_rows)
+    def _saved_ai_rows(self, user_id): # Runs on the DB worker so the UI thread only inserts
+        return [(str(row[0]), row[1:]) for row in self.controller.db_manager.get_ai_content(user_id, display=True) or []]
     def display_selected_ai_content(self, event=None): 
         sel_id = self.ai_tree.focus(); 
         if not sel_id: return
-        det = self.controller.db_manager.get_ai_content_detail(int(sel_id))
+        det = self._details.get(sel_id)
+        if det is None: det = self._details[sel_id] = self.controller.db_manager.get_ai_content_detail(int(sel_id))
         if det: 
-            txt = f"Type: {det[1]}\nTitle: {det[0]}\nSaved: {det[4]}\n\n"
-            if det[2]: txt += f"--- Input ---\n{det[2]}\n\n"
-            txt += f"--- AI Response ---\n{det[3]}"
+            parts = [f"Type: {det[1]}\nTitle: {det[0]}\nSaved: {det[4]}\n\n", ()]
+            if det[2]: parts += ["--- Input ---\n", (), det[2], (), "\n\n", ()]
+            parts += ["--- AI Response ---\n", (), det[3] or ""]
             self.ai_disp.config(state=tk.NORMAL); self.ai_disp.delete("1.0",tk.END)
-            self.ai_disp.insert(tk.END,txt); self.ai_disp.config(state=tk.DISABLED)
+            self.ai_disp.insert(tk.END, *parts); self.ai_disp.config(state=tk.DISABLED) # One insert of chars/tags pairs: the long texts are never concatenated
     def delete_selected_ai_content(self): 
         sel_id = self.ai_tree.focus(); 
         if not sel_id: messagebox.showwarning("Sel Error","Select item to delete."); return
         if messagebox.askyesno("Confirm","Delete saved AI content?"):
             if self.controller.db_manager.delete_ai_content(int(sel_id)):
-                self._load_saved_ai_content(); self.controller.update_status("AI content deleted.",3000)
+                self.controller.mark_dirty("ai"); self.controller.needs_reload(self, "ai"); self._load_saved_ai_content(); self.controller.update_status("AI content deleted.",3000)
             else: messagebox.showerror("Error","Delete failed."); self.controller.update_status("Delete failed.",3000)
     def _load_study_logs_for_review(self): 
-        for i in self.rev_logs_tree.get_children(): self.rev_logs_tree.delete(i)
-        logs = self.controller.db_manager.get_study_logs(self.controller.current_user_id) 
-        if logs:
-            for log in logs: 
-                lid,s,st,dur,n=log
-                try: dt_o=datetime.datetime.strptime(st,"%Y-%m-%d %H:%M:%S"); d_d=dt_o.strftime("%Y-%m-%d %H:%M")
-                except ValueError: d_d=st 
-                dur_d=f"{dur} min"; self.rev_logs_tree.insert("","end",values=(s,d_d,dur_d,n),iid=str(lid))
+        self.controller.db_worker.submit(study_log_rows, self.controller.db_manager, self.controller.current_user_id, callback=self.logs_window.set_rows)
 
 
 # --- Other Frames (TaskManagerFrame, StudyTrackerFrame, QuizFrame, QuizReviewer, AIHelperFrame, SettingsFrame, AnalyticsFrame) ---
 
 class TaskManagerFrame(ttk.Frame): 
     def __init__(self, parent, controller): 
-        super().__init__(parent); self.controller = controller; self.user_task_categories = []
+        super().__init__(parent); self.controller = controller; self.user_task_categories = []; self._refresh_pending = None
         ttk.Label(self, text="Task Manager", style="Header.TLabel").pack(pady=10) 
         filter_add_frame = ttk.Frame(self); filter_add_frame.pack(pady=5, fill=tk.X, padx=20)
         ttk.Label(filter_add_frame, text="Filter:").pack(side=tk.LEFT, padx=(0,5))
         self.category_filter_combobox = ttk.Combobox(filter_add_frame, state="readonly", width=15, font=("Arial", 10))
         self.category_filter_combobox.pack(side=tk.LEFT, padx=5)
-        self.category_filter_combobox.bind("<<ComboboxSelected>>", lambda e: self.refresh_data())
+        self.category_filter_combobox.bind("<<ComboboxSelected>>", lambda e: self._debounced_refresh())
         # Export .ics button REMOVED
         # ttk.Button(filter_add_frame, text="Export .ics", command=self.export_tasks_to_ics).pack(side=tk.RIGHT, padx=5)
         input_frame = ttk.Frame(self); input_frame.pack(pady=10, fill=tk.X, padx=20)
@@ -702,12 +1188,14 @@ class TaskManagerFrame(ttk.Frame):
         action_frame = ttk.Frame(self); action_frame.pack(pady=10, padx=20, fill=tk.X)
         ttk.Button(action_frame, text="Toggle Status", command=self.toggle_task_status).pack(side=tk.LEFT, padx=5) 
         ttk.Button(action_frame, text="Delete Task", command=self.delete_task, style="Danger.TButton").pack(side=tk.LEFT, padx=5)
-        self.show_completed_var = tk.BooleanVar(); ttk.Checkbutton(action_frame, text="Show Completed", variable=self.show_completed_var, command=self.refresh_data, style="TCheckbutton").pack(side=tk.LEFT, padx=10)
+        self.show_completed_var = tk.BooleanVar(); ttk.Checkbutton(action_frame, text="Show Completed", variable=self.show_completed_var, command=self._debounced_refresh, style="TCheckbutton").pack(side=tk.LEFT, padx=10)
         ttk.Button(self, text="Back to Main Menu", command=lambda: self.controller.show_frame("MainPage")).pack(pady=10, side=tk.BOTTOM)
     
     def load_categories(self): 
         if self.controller.current_user_id:
-            self.user_task_categories = self.controller.db_manager.get_task_categories(self.controller.current_user_id)
+            cats = self.controller.db_manager.get_task_categories(self.controller.current_user_id)
+            if cats == self.user_task_categories and self.category_filter_combobox.get(): return # Unchanged: keep the lists and the user's picks
+            self.user_task_categories = cats
             self.category_combobox['values'] = self.user_task_categories
             self.category_combobox.set("General" if "General" in self.user_task_categories else (self.user_task_categories[0] if self.user_task_categories else ""))
             self.category_filter_combobox['values'] = ["All Categories"] + self.user_task_categories
@@ -727,9 +1215,12 @@ class TaskManagerFrame(ttk.Frame):
             self.controller.show_frame("LoginPage")
             return
 
-        print(f"TaskManagerFrame.add_task: User ID: {uid}, Desc: '{description}', Cat: '{cat}', Due: '{due_str}'") # Debug print
-        
-        if self.controller.db_manager.add_task(uid, description, cat, due_str if due_str else None):
+        log.debug("TaskManagerFrame.add_task uid=%s desc=%r cat=%r due=%r", uid, description, cat, due_str)
+        self.controller.db_worker.submit(self.controller.db_manager.add_task, uid, description, cat, due_str if due_str else None, callback=lambda res: self._task_added(res, description))
+
+    def _task_added(self, res, description):
+        if res:
+            self.controller.mark_dirty("tasks")
             self.controller.update_status(f"Task '{description[:20]}...' added.", 3000)
             self.task_entry.delete(0, tk.END); self.due_date_entry.delete(0, tk.END); self.due_date_entry.insert(0, datetime.date.today().strftime('%Y-%m-%d'))
             self.refresh_data()
@@ -739,16 +1230,25 @@ class TaskManagerFrame(ttk.Frame):
             
     def refresh_data(self): # Same
         if not self.controller.current_user_id: self.controller.show_frame("LoginPage"); return 
-        self.load_categories(); 
-        for i in self.task_tree.get_children(): self.task_tree.delete(i)
+        self.load_categories()
+        if self.controller.needs_reload(self, "tasks"): self._reload_tasks()
+
+    def _debounced_refresh(self): # Filter/checkbox bursts coalesce into one reload 150 ms after the last event
+        if self._refresh_pending: self.after_cancel(self._refresh_pending)
+        self._refresh_pending = self.after(150, self._reload_tasks)
+
+    def _reload_tasks(self): # Tasks only: leaves the category lists (and the chosen filter) alone
+        self._refresh_pending = None
+        if not self.controller.current_user_id: return
         cat_filter = self.category_filter_combobox.get()
-        tasks = self.controller.db_manager.get_tasks(self.controller.current_user_id, self.show_completed_var.get(), cat_filter)
-        if tasks:
-            for task in tasks:
-                tid, d, c, due, comp, cr_at = task; stat = "Completed" if comp else "Pending"; due_d = due if due else "N/A" 
-                try: cr_dt = datetime.datetime.strptime(cr_at, "%Y-%m-%d %H:%M:%S.%f") if '.' in cr_at else datetime.datetime.strptime(cr_at, "%Y-%m-%d %H:%M:%S"); cr_disp = cr_dt.strftime("%y-%m-%d %H:%M")
-                except ValueError: cr_disp = cr_at 
-                self.task_tree.insert("", tk.END, values=(d, c, due_d, stat, cr_disp), iid=str(tid))
+        self.controller.db_worker.submit(self._task_rows, self.controller.current_user_id, self.show_completed_var.get(), cat_filter, callback=self._show_tasks)
+
+    def _task_rows(self, user_id, show_completed, cat_filter): # Runs on the DB worker
+        return [(str(row[0]), row[1:]) for row in self.controller.db_manager.get_tasks(user_id, show_completed, cat_filter, display=True) or []]
+
+    def _show_tasks(self, rows):
+        if rows is None: self.controller.update_status("Task list failed to load.", 3000); return # Worker job failed; keep what's shown
+        self.controller.populate_tree(self.task_tree, rows)
         self.controller.update_status("Task list refreshed.")
     
     # export_tasks_to_ics method REMOVED
@@ -761,24 +1261,33 @@ class TaskManagerFrame(ttk.Frame):
     def toggle_task_status(self): # Same
         tid = self.get_selected_task_id(); 
         if tid is None: return 
-        t_details = self.controller.db_manager.fetch_one("SELECT completed, description FROM tasks WHERE task_id=? AND user_id=?", (tid, self.controller.current_user_id))
-        if t_details:
-            n_stat = not t_details[0]; t_desc = t_details[1][:20] 
-            if self.controller.db_manager.update_task_status(tid, n_stat):
-                self.refresh_data(); s_txt = "completed" if n_stat else "pending"
-                self.controller.update_status(f"Task '{t_desc}...' {s_txt}.", 3000)
-            else: messagebox.showerror("DB Error", "Update failed."); self.controller.update_status("Task update failed.", 3000)
-        else: messagebox.showerror("Error", "Task not found/permission.")
+        self.controller.db_worker.submit(self._flip_task, self.controller.current_user_id, tid, callback=self._task_flipped)
+    def _flip_task(self, user_id, tid): # DB worker: the read and the update share one batch, so no write lands between them
+        db = self.controller.db_manager
+        t_details = db.fetch_one("SELECT completed, description FROM tasks WHERE task_id=? AND user_id=?", (tid, user_id))
+        if not t_details: return "missing"
+        n_stat = not t_details[0]
+        return (n_stat, t_details[1][:20]) if db.update_task_status(tid, n_stat) else None
+    def _task_flipped(self, res):
+        if res == "missing": messagebox.showerror("Error", "Task not found/permission."); return
+        if res:
+            n_stat, t_desc = res; self.controller.mark_dirty("tasks"); self.refresh_data(); s_txt = "completed" if n_stat else "pending"
+            self.controller.update_status(f"Task '{t_desc}...' {s_txt}.", 3000)
+        else: messagebox.showerror("DB Error", "Update failed."); self.controller.update_status("Task update failed.", 3000)
     def delete_task(self): # Same
         tid = self.get_selected_task_id(); 
         if tid is None: return
-        t_details = self.controller.db_manager.fetch_one("SELECT description FROM tasks WHERE task_id=? AND user_id=?", (tid, self.controller.current_user_id))
-        if not t_details: messagebox.showerror("Error", "Task not found/permission."); return
-        t_desc = t_details[0][:20]
+        t_desc = str(self.task_tree.set(str(tid), "Description"))[:20] # From the shown row; the worker re-checks ownership
         if messagebox.askyesno("Confirm", f"Delete '{t_desc}...'?"):
-            if self.controller.db_manager.delete_task(tid): 
-                self.refresh_data(); self.controller.update_status(f"Task '{t_desc}...' deleted.", 3000)
-            else: messagebox.showerror("DB Error", "Delete failed."); self.controller.update_status("Task delete failed.", 3000)
+            self.controller.db_worker.submit(self._remove_task, self.controller.current_user_id, tid, callback=lambda res: self._task_removed(res, t_desc))
+    def _remove_task(self, user_id, tid): # DB worker
+        db = self.controller.db_manager
+        if not db.fetch_one("SELECT 1 FROM tasks WHERE task_id=? AND user_id=?", (tid, user_id)): return "missing"
+        return db.delete_task(tid)
+    def _task_removed(self, res, t_desc):
+        if res == "missing": messagebox.showerror("Error", "Task not found/permission."); return
+        if res: self.controller.mark_dirty("tasks"); self.refresh_data(); self.controller.update_status(f"Task '{t_desc}...' deleted.", 3000)
+        else: messagebox.showerror("DB Error", "Delete failed."); self.controller.update_status("Task delete failed.", 3000)
 
 
 class StudyTrackerFrame(ttk.Frame): # Updated with Pomodoro
@@ -829,27 +1338,28 @@ class StudyTrackerFrame(ttk.Frame): # Updated with Pomodoro
 
     def toggle_pomodoro_mode_ui(self): # Same
         if self.pomodoro_mode.get():
-            self.pomodoro_status_label.config(text=f"Mode: Pomodoro ({self.controller.pomodoro_work_duration.get()}m work / {self.controller.pomodoro_break_duration.get()}m break)")
+            self.pomodoro_status_label.config(text=f"Mode: Pomodoro ({self.controller._dur_s_by_state['work']//60}m work / {self.controller._dur_s_by_state['break']//60}m break)")
             self.reset_timer() 
         else:
             self.pomodoro_status_label.config(text="Mode: Standard Timer"); self.pomodoro_cycle_label.config(text=""); self.reset_timer() 
 
-    def update_timer_display(self): # Same
+    def update_timer_display(self): # Ticks on whole-second boundaries of the monotonic start time; label untouched while the frame is hidden
         if self.timer_running and self.start_time:
-            el_s = int(time.time() - self.start_time)
+            el = time.monotonic() - self.start_time; el_s = int(el)
             if self.pomodoro_mode.get():
-                curr_dur_s = (self.controller.pomodoro_work_duration.get() if self.pomodoro_state == "work" else self.controller.pomodoro_break_duration.get()) * 60
-                rem_s = curr_dur_s - el_s
+                rem_s = self.controller._dur_s_by_state[self.pomodoro_state] - el_s
                 if rem_s <= 0: 
                     if self.pomodoro_state == "work":
                         self.pomodoro_state = "break"; self.pomodoro_cycles_done +=1; self.pomodoro_cycle_label.config(text=f"Cycles: {self.pomodoro_cycles_done}")
-                        self.controller.update_status("Pomodoro: Break time!", 0); messagebox.showinfo("Pomodoro Break", f"Work done! Break for {self.controller.pomodoro_break_duration.get()} min.")
+                        self.controller.update_status("Pomodoro: Break time!", 0); messagebox.showinfo("Pomodoro Break", f"Work done! Break for {self.controller._dur_s_by_state['break']//60} min.")
                     else: 
                         self.pomodoro_state = "work"; self.controller.update_status("Pomodoro: Work time!", 0); messagebox.showinfo("Pomodoro Work", "Break over! Next session.")
-                    self.start_time = time.time(); el_s = 0; rem_s = (self.controller.pomodoro_work_duration.get() if self.pomodoro_state == "work" else self.controller.pomodoro_break_duration.get()) * 60
-                h,r=divmod(rem_s,3600);m,s=divmod(r,60); self.timer_label.config(text=f"{self.pomodoro_state.capitalize()}: {h:02}:{m:02}:{s:02}")
-            else: h,r=divmod(el_s,3600);m,s=divmod(r,60); self.timer_label.config(text=f"Timer: {h:02}:{m:02}:{s:02}")
-            self.timer_id = self.after(1000, self.update_timer_display)
+                    self._timer_prefix = f"{self.pomodoro_state.capitalize()}: "
+                    self.start_time = time.monotonic(); el = 0.0; rem_s = self.controller._dur_s_by_state[self.pomodoro_state]
+                shown_s = rem_s
+            else: shown_s = el_s
+            if self.controller.current_frame_name == "StudyTrackerFrame": h,r=divmod(shown_s,3600);m,s=divmod(r,60); self.timer_label.config(text=f"{self._timer_prefix}{h:02}:{m:02}:{s:02}")
+            self.timer_id = self.after(1000 - int(el * 1000) % 1000, self.update_timer_display)
 
     def toggle_timer(self): # Same
         if self.timer_running: 
@@ -857,10 +1367,11 @@ class StudyTrackerFrame(ttk.Frame): # Updated with Pomodoro
             if self.timer_id: self.after_cancel(self.timer_id); self.timer_id=None
             self.start_timer_button.config(text="Start Timer")
             if self.start_time and not self.pomodoro_mode.get(): 
-                el_min=int((time.time()-self.start_time)/60); self.duration_entry.delete(0,tk.END); self.duration_entry.insert(0,str(el_min if el_min>0 else 1)) 
+                el_min=int((time.monotonic()-self.start_time)/60); self.duration_entry.delete(0,tk.END); self.duration_entry.insert(0,str(el_min if el_min>0 else 1)) 
             self.controller.update_status(f"Timer stopped.",3000)
         else: 
-            self.timer_running=True; self.start_time=time.time(); self.start_timer_button.config(text="Stop Timer")
+            self.timer_running=True; self.start_time=time.monotonic(); self.start_timer_button.config(text="Stop Timer")
+            self._timer_prefix = "Work: " if self.pomodoro_mode.get() else "Timer: "
             if self.pomodoro_mode.get():
                 self.pomodoro_state="work"; self.pomodoro_cycle_label.config(text=f"Cycles: {self.pomodoro_cycles_done}"); self.controller.update_status(f"Pomodoro work started!",3000)
             else: self.controller.update_status("Timer started!",3000)
@@ -869,7 +1380,7 @@ class StudyTrackerFrame(ttk.Frame): # Updated with Pomodoro
     def reset_timer(self): # Same
         if self.timer_running: self.toggle_timer() 
         self.start_time=None; self.pomodoro_cycles_done=0; self.pomodoro_state="work" 
-        if self.pomodoro_mode.get(): self.timer_label.config(text=f"Work: {self.controller.pomodoro_work_duration.get():02}:00:00"); self.pomodoro_cycle_label.config(text="Cycles: 0")
+        if self.pomodoro_mode.get(): self.timer_label.config(text=f"Work: {self.controller._dur_s_by_state['work']//60:02}:00:00"); self.pomodoro_cycle_label.config(text="Cycles: 0")
         else: self.timer_label.config(text="Timer: 00:00:00"); self.pomodoro_cycle_label.config(text="")
         self.duration_entry.delete(0,tk.END); self.controller.update_status("Timer reset.",3000)
 
@@ -883,32 +1394,29 @@ class StudyTrackerFrame(ttk.Frame): # Updated with Pomodoro
         uid=self.controller.current_user_id
         if uid:
             start_s=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") 
-            if self.controller.db_manager.add_study_log(uid,subj,start_s,dur_min,notes):
-                self.controller.update_status(f"Session '{subj}' logged.",3000)
-                self.subject_entry.delete(0,tk.END); self.duration_entry.delete(0,tk.END); self.notes_text.delete("1.0",tk.END); self.reset_timer(); self.refresh_data() 
-            else: messagebox.showerror("DB Error","Log failed."); self.controller.update_status("Log failed.",3000)
+            self.controller.db_worker.submit(self.controller.db_manager.add_study_log,uid,subj,start_s,dur_min,notes,callback=lambda res: self._session_logged(res,subj))
         else: messagebox.showerror("Auth Error","No user."); self.controller.show_frame("LoginPage")
 
+    def _session_logged(self, res, subj):
+        if res:
+            self.controller.mark_dirty("logs"); self.controller.update_status(f"Session '{subj}' logged.",3000)
+            self.subject_entry.delete(0,tk.END); self.duration_entry.delete(0,tk.END); self.notes_text.delete("1.0",tk.END); self.reset_timer(); self.refresh_data() 
+        else: messagebox.showerror("DB Error","Log failed."); self.controller.update_status("Log failed.",3000)
+
     def refresh_data(self): # Same
         if not self.controller.current_user_id: self.controller.show_frame("LoginPage"); return
-        for i in self.log_tree.get_children(): self.log_tree.delete(i)
-        logs=self.controller.db_manager.get_study_logs(self.controller.current_user_id,limit=100) 
-        if logs:
-            for log in logs: 
-                _,s,st,dur,n=log; 
-                try: dt=datetime.datetime.strptime(st,"%Y-%m-%d %H:%M:%S"); date_d=dt.strftime("%Y-%m-%d %H:%M")
-                except ValueError: date_d=st 
-                dur_d=f"{dur} min"; self.log_tree.insert("","end",values=(s,date_d,dur_d,n))
+        if self.controller.needs_reload(self, "logs"): self.controller.db_worker.submit(study_log_rows,self.controller.db_manager,self.controller.current_user_id,100,False,callback=lambda rows: self.controller.populate_tree(self.log_tree, rows))
         self.toggle_pomodoro_mode_ui(); 
         if not self.timer_running: self.controller.update_status("Study Tracker ready.")
 
 
+
 class QuizFrame(ttk.Frame): # Kept for context, largely same
     def __init__(self, parent, controller): 
         super().__init__(parent); self.controller = controller; self.quiz_questions_full_data = []; self.current_question_index = 0
-        self.score = 0; self.quiz_topic = ""; self.num_questions_to_generate = 5 
+        self.score = 0; self.quiz_topic = ""; self.num_questions_to_generate = 5; self._gen_inflight = False # Set from click until _quiz_ready
         setup_frame = ttk.Frame(self, padding=10); setup_frame.pack(pady=10, fill=tk.X)
-        ttk.Label(setup_frame, text="Quiz Topic:", font=("Arial", 12)).pack(side=tk.LEFT, padx=5)
+        ttk.Label(setup_frame, text="Quiz Topic(s) (a; b):", font=("Arial", 12)).pack(side=tk.LEFT, padx=5)
         self.topic_entry = ttk.Entry(setup_frame, width=30, font=("Arial", 11)); self.topic_entry.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X, ipady=2)
         self.topic_entry.insert(0, "World Capitals") 
         ttk.Label(setup_frame, text="#Q:", font=("Arial", 12)).pack(side=tk.LEFT, padx=(10,0)) 
@@ -918,9 +1426,9 @@ class QuizFrame(ttk.Frame): # Kept for context, largely same
         self.loading_label = ttk.Label(setup_frame, text="", style="Placeholder.TLabel"); self.loading_label.pack(side=tk.LEFT, padx=5)
         self.quiz_area = ttk.Frame(self, padding=10)
         self.question_label = ttk.Label(self.quiz_area, text="", wraplength=750, font=("Arial", 14, "bold"), anchor="center", justify=tk.CENTER); self.question_label.pack(pady=20, fill=tk.X)
-        self.radio_var = tk.StringVar(); self.option_buttons_frame = ttk.Frame(self.quiz_area) 
+        self.radio_var = tk.IntVar(value=-1); self.option_buttons_frame = ttk.Frame(self.quiz_area) 
         self.option_buttons_frame.pack(pady=10, fill=tk.X, padx=20); self.option_buttons = [] 
-        for i in range(4): rb = ttk.Radiobutton(self.option_buttons_frame, text="", variable=self.radio_var, value="", style="TRadiobutton"); self.option_buttons.append(rb)
+        for i in range(4): rb = ttk.Radiobutton(self.option_buttons_frame, text="", variable=self.radio_var, value=i, style="TRadiobutton"); self.option_buttons.append(rb)
         self.submit_button = ttk.Button(self.quiz_area, text="Submit Answer", command=self.submit_answer, state=tk.DISABLED); self.submit_button.pack(pady=20)
         self.feedback_label = ttk.Label(self.quiz_area, text="", font=("Arial", 11), wraplength=750, justify=tk.CENTER); self.feedback_label.pack(pady=10)
         self.result_area = ttk.Frame(self, padding=10)
@@ -931,38 +1439,65 @@ class QuizFrame(ttk.Frame): # Kept for context, largely same
         ttk.Button(self, text="Back to Main Menu", command=self.go_back_to_main).pack(side=tk.BOTTOM, pady=20)
     def go_back_to_main(self): self.reset_quiz_ui(); self.controller.show_frame("MainPage")
     def start_quiz_generation_thread(self): # Same
+        if self._gen_inflight: return # Double-click, or Generate re-enabled by navigating away and back mid-generation
         self.quiz_topic=self.topic_entry.get().strip(); self.num_questions_to_generate=int(self.num_questions_spinbox.get())
         if not self.quiz_topic: messagebox.showerror("Error","Topic empty."); return
-        self.loading_label.config(text="Generating..."); self.generate_button.config(state=tk.DISABLED); self.reset_quiz_ui_elements() 
-        threading.Thread(target=self.generate_ai_quiz,daemon=True).start()
-    def generate_ai_quiz(self): # Same
-        api_key=GEMINI_API_KEY or self.controller.db_manager.get_config_value('GEMINI_API_KEY') or ""
-        if not api_key: self.controller.after(0,lambda:messagebox.showerror("API Key Error","Key missing.")); self.controller.after(0,self.generation_finished); return
-        prompt = (f"Gen {self.num_questions_to_generate} MCQ on '{self.quiz_topic}'. Each: 'question_text', 'options' (4 strings), 'correct_option_index' (0-3 int), 'explanation'.")
-        payload = {"contents": [{"role": "user", "parts": [{"text": prompt}]}],"generationConfig": {"responseMimeType": "application/json","responseSchema": {"type": "ARRAY", "items": { "type": "OBJECT", "properties": {"question_text": {"type": "STRING"}, "options": { "type": "ARRAY", "items": {"type": "STRING"}, "minItems": 4, "maxItems": 4},"correct_option_index": {"type": "INTEGER"}, "explanation": {"type": "STRING"}},"required": ["question_text", "options", "correct_option_index", "explanation"]}}}}
-        url=f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
-        try:
-            import requests; r=requests.post(url,headers={'Content-Type':'application/json'},json=payload,timeout=90); r.raise_for_status(); res=r.json()
-            if res.get("candidates") and res["candidates"][0].get("content",{}).get("parts"):
-                txt=res["candidates"][0]["content"]["parts"][0].get("text")
-                if txt:
-                    data=json.loads(txt); v_q=[]
-                    if isinstance(data,list):
-                        for q in data:
-                            if isinstance(q,dict) and all(k in q for k in ["question_text","options","correct_option_index","explanation"]) and isinstance(q.get("options",[]),list) and len(q["options"])==4 and all(isinstance(o,str) for o in q["options"]) and isinstance(q.get("correct_option_index",-1),int) and 0<=q["correct_option_index"]<=3:
-                                q_c=q.copy(); q_c['user_answer_index']=None; v_q.append(q_c)
-                        self.quiz_questions_full_data=v_q
-                    if self.quiz_questions_full_data: self.controller.after(0,self.display_quiz_start); self.controller.after(0,lambda:self.controller.update_status(f"Quiz '{self.quiz_topic}' ready!",3000))
-                    else: self.controller.after(0,lambda:messagebox.showwarning("Quiz Gen","AI gave no valid Qs.")); self.controller.after(0,lambda:self.controller.update_status("Quiz gen failed.",3000))
-                else: self.controller.after(0,lambda:messagebox.showerror("API Error","AI response no content."))
-            else: 
-                err="API response unexpected."; fb=res.get("promptFeedback",{}); br=fb.get("blockReason"); 
-                if br: err+=f" Blocked: {br}"
-                elif res.get("error"): err+=f" API Error: {res['error'].get('message','Unknown')}"
-                self.controller.after(0,lambda:messagebox.showerror("API Error",err))
-        except Exception as e: print(f"Quiz gen err: {e}"); self.controller.after(0,lambda:messagebox.showerror("Error",f"Quiz error: {e}"))
-        finally: self.controller.after(0,self.generation_finished)
-    def generation_finished(self): self.loading_label.config(text=""); self.generate_button.config(state=tk.NORMAL)
+        self._gen_inflight=True; self.loading_label.config(text="Generating..."); self.generate_button.config(state=tk.DISABLED); self.reset_quiz_ui_elements() 
+        self.generate_ai_quiz()
+    QUIZ_KEYS = ("question_text","options","correct_option_index","explanation")
+    STORED_KEYS = QUIZ_KEYS + ("user_answer_index",); _stored_values = operator.itemgetter(*STORED_KEYS) # What an attempt persists (no _feedback)
+    QUIZ_SCHEMA = {"type": "OBJECT", "properties": {"question_text": {"type": "STRING"}, "options": { "type": "ARRAY", "items": {"type": "STRING"}, "minItems": 4, "maxItems": 4},"correct_option_index": {"type": "INTEGER"}, "explanation": {"type": "STRING"}},"required": list(QUIZ_KEYS)} # One question per call
+    # Fixed instruction sent ahead of the short per-question prompt, so every quiz request shares one identical prefix
+    QUIZ_INSTRUCTION = {"parts": [{"text": "Generate 1 multiple-choice question for a student, aimed at the focus given with the topic. Fields: 'question_text', 'options' (4 strings), 'correct_option_index' (0-3 int), 'explanation'."}]}
+    # Per-index angle, basic to advanced: the parallel calls can't see each other, so distinct focuses keep them from overlapping
+    QUIZ_FOCUS = ("a core definition or key term", "a basic fact", "how two ideas differ", "cause and effect", "a worked example",
+                  "a common misconception", "applying it to a new situation", "a less obvious detail", "analysing a scenario", "an edge case or limitation")
+    @staticmethod
+    def _valid_question(q): # QUIZ_SCHEMA checked by hand: one lookup per field, exact types (a bool is not an index)
+        if type(q) is not dict: return False
+        opts = q.get("options"); idx = q.get("correct_option_index")
+        return (type(q.get("question_text")) is str and type(q.get("explanation")) is str and type(opts) is list and len(opts) == 4
+                and all(type(o) is str for o in opts) and type(idx) is int and 0 <= idx <= 3)
+    def _ask_one(self, topic, i, n):
+        """Generates question i of n with its own call; returns it, or raises with the API's complaint."""
+        prompt = f"Topic: '{topic}'. Question {i+1} of {n}. Focus: {self.QUIZ_FOCUS[i % len(self.QUIZ_FOCUS)]}."
+        payload = {"systemInstruction": self.QUIZ_INSTRUCTION, "contents": [{"role": "user", "parts": [{"text": prompt}]}],"generationConfig": {"responseMimeType": "application/json","responseSchema": self.QUIZ_SCHEMA}}
+        res=self.controller.gemini_call(payload,timeout=90,ttl=0,mode="quiz") # Uncached: generating again must give new questions
+        if not (res.get("candidates") and res["candidates"][0].get("content",{}).get("parts")):
+            err="API response unexpected."; br=res.get("promptFeedback",{}).get("blockReason")
+            if br: err+=f" Blocked: {br}"
+            elif res.get("error"): err+=f" API Error: {res['error'].get('message','Unknown')}"
+            raise ValueError(err)
+        txt=res["candidates"][0]["content"]["parts"][0].get("text")
+        if not txt: raise ValueError("AI response no content.")
+        q=json.loads(txt)
+        if isinstance(q,list): q=next((x for x in q if self._valid_question(x)),None) # Older-style array reply: first valid one only
+        if not self._valid_question(q): raise ValueError("AI gave no valid question.")
+        order=list(range(4)); random.shuffle(order) # Shuffled here, on the pool thread, so the Tk side only indexes
+        opts=[q["options"][j] for j in order]; corr=order.index(q["correct_option_index"]); exp=q.get("explanation","")
+        return dict(q, options=opts, correct_option_index=corr, user_answer_index=None,
+                    _feedback=(f"Correct! {exp}", f"Incorrect. Correct: \"{opts[corr]}\".\nExp: {exp}"))
+    def generate_ai_quiz(self): # One call per question on the shared pool: latency is the slowest call, not the sum, and no thread waits on the others
+        if not self.controller.gemini_api_key: messagebox.showerror("API Key Error","Key missing."); self.generation_finished(); return
+        topic, n = self.quiz_topic, self.num_questions_to_generate; by_index = {}; errors = []; lock = threading.Lock()
+        topics = [t.strip() for t in topic.split(";") if t.strip()] or [topic] # "a; b" mixes topics; one topic is just a one-element list
+        jobs = [(topics[i % len(topics)], i // len(topics), len(range(i % len(topics), n, len(topics)))) for i in range(n)] # (topic, index within topic, count for topic)
+        def collect(fut, i): # Runs on whichever pool thread finished; the last one hands everything to the Tk thread
+            try: q = fut.result(); e = None
+            except Exception as exc: log.warning("Quiz gen err (q%d): %s", i+1, exc); q = None; e = exc
+            with lock:
+                if e is None: by_index[i] = q
+                else: errors.append(e)
+                last = len(by_index) + len(errors) == n
+            if last: self.controller.after(0, self._quiz_ready, topic, n, by_index, errors)
+        for i, job in enumerate(jobs): self.controller.ai_pool.submit(self._ask_one, *job).add_done_callback(lambda f, i=i: collect(f, i))
+    def _quiz_ready(self, topic, n, by_index, errors):
+        self.quiz_questions_full_data=[by_index[i] for i in sorted(by_index)]
+        if self.quiz_questions_full_data: self.display_quiz_start(); self.controller.update_status(f"Quiz '{topic}' ready!" + (f" ({len(errors)} question(s) failed)" if errors else ""),3000)
+        elif errors: messagebox.showerror("API Error" if isinstance(errors[0],ValueError) else "Error",f"Quiz error: {errors[0]}")
+        else: messagebox.showwarning("Quiz Gen","AI gave no valid Qs."); self.controller.update_status("Quiz gen failed.",3000)
+        self.generation_finished()
+    def generation_finished(self): self._gen_inflight=False; self.loading_label.config(text=""); self.generate_button.config(state=tk.NORMAL)
     def display_quiz_start(self): # Same
         if not self.quiz_questions_full_data: messagebox.showwarning("Quiz Not Ready","No Qs."); self.reset_quiz_ui(); return
         self.current_question_index=0; self.score=0; self.quiz_area.pack(fill=tk.BOTH,expand=True)
@@ -972,24 +1507,19 @@ class QuizFrame(ttk.Frame): # Kept for context, largely same
         if self.current_question_index < len(self.quiz_questions_full_data):
             q=self.quiz_questions_full_data[self.current_question_index]
             self.question_label.config(text=f"Q{self.current_question_index+1}: {q['question_text']}")
-            self.radio_var.set(None); self.feedback_label.config(text="",style="TLabel")
-            for w in self.option_buttons_frame.winfo_children(): w.pack_forget()
-            for i,opt in enumerate(q['options']):
-                self.option_buttons[i].config(text=opt,value=opt,state=tk.NORMAL)
-                self.option_buttons[i].pack(anchor=tk.W,padx=30,pady=5,fill=tk.X)
+            self.radio_var.set(-1); self.feedback_label.config(text="",style="TLabel")
+            for i,opt in enumerate(q['options']): # Buttons stay packed between questions: only text/state change
+                rb=self.option_buttons[i]; rb.config(text=opt,state=tk.NORMAL) # Button i carries value i: no text lookup on submit
+                if not rb.winfo_manager(): rb.pack(anchor=tk.W,padx=30,pady=5,fill=tk.X)
             self.submit_button.config(text="Submit Answer",command=self.submit_answer)
         else: self.show_results()
     def submit_answer(self): # Same
-        sel_ans=self.radio_var.get()
-        if not sel_ans: messagebox.showwarning("No Answer","Select option."); return
+        sel_idx=self.radio_var.get()
+        if sel_idx<0: messagebox.showwarning("No Answer","Select option."); return
         q=self.quiz_questions_full_data[self.current_question_index]
-        try: sel_idx=q['options'].index(sel_ans)
-        except ValueError: messagebox.showerror("Error","Selected ans not in opts."); return
         q['user_answer_index']=sel_idx
-        corr_idx=q['correct_option_index']; corr_txt=q['options'][corr_idx]
-        is_c=(sel_idx==corr_idx)
-        if is_c: self.score+=1; self.feedback_label.config(text=f"Correct! {q.get('explanation','')}",style="Success.TLabel")
-        else: self.feedback_label.config(text=f"Incorrect. Correct: \"{corr_txt}\".\nExp: {q.get('explanation','')}",style="Error.TLabel")
+        if sel_idx==q['correct_option_index']: self.score+=1; self.feedback_label.config(text=q['_feedback'][0],style="Success.TLabel")
+        else: self.feedback_label.config(text=q['_feedback'][1],style="Error.TLabel")
         for rb in self.option_buttons: rb.config(state=tk.DISABLED)
         self.submit_button.config(text="Next Question",command=self.next_question)
     def next_question(self): # Same
@@ -1003,23 +1533,25 @@ class QuizFrame(ttk.Frame): # Kept for context, largely same
         self.controller.update_status(f"Quiz '{self.quiz_topic}' done. Score: {self.score}/{num_q}",5000)
         if self.controller.current_user_id and num_q>0:
             q_date=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            q_data_store=[{'question_text':q["question_text"],'options':q["options"],'correct_option_index':q["correct_option_index"],'explanation':q["explanation"],'user_answer_index':q["user_answer_index"]} for q in self.quiz_questions_full_data] 
-            q_json=json.dumps(q_data_store)
-            self.controller.db_manager.add_quiz_attempt(self.controller.current_user_id,self.quiz_topic,q_date,self.score,num_q,q_json)
+            keys,vals=self.STORED_KEYS,self._stored_values; q_data_store=[dict(zip(keys,vals(q))) for q in self.quiz_questions_full_data]
+            db=self.controller.db_manager
+            def save(uid,topic,score): return db.add_quiz_attempt(uid,topic,q_date,score,num_q,json_compact(q_data_store)) # Encoding and commit on the DB worker
+            self.controller.db_worker.submit(save,self.controller.current_user_id,self.quiz_topic,self.score,
+                                             callback=lambda res: self.controller.mark_dirty("quiz") if res else self.controller.update_status("Saving quiz attempt failed.",5000))
     def review_quiz(self): # Same
         if not self.quiz_questions_full_data: messagebox.showinfo("No Quiz Data","No quiz to review."); return
         rev=tk.Toplevel(self.controller); rev.title(f"Review: {self.quiz_topic}"); rev.geometry("700x550"); rev.configure(bg="#e8eaf6")
         QuizReviewer(rev,self.quiz_questions_full_data,self.controller); self.controller.update_status(f"Reviewing quiz: {self.quiz_topic}")
     def reset_for_new_quiz(self): # Same
         self.result_area.pack_forget(); self.quiz_area.pack_forget(); self.topic_entry.delete(0,tk.END); self.topic_entry.insert(0,"World History")
-        self.num_questions_spinbox.set(self.num_questions_to_generate); self.generate_button.config(state=tk.NORMAL)
+        self.num_questions_spinbox.set(self.num_questions_to_generate); self.generate_button.config(state=tk.DISABLED if self._gen_inflight else tk.NORMAL)
         self.review_quiz_button.config(state=tk.DISABLED); self.quiz_questions_full_data=[]; self.reset_quiz_ui_elements()
     def reset_quiz_ui(self): # Same
         self.quiz_area.pack_forget(); self.result_area.pack_forget(); self.reset_quiz_ui_elements()
         self.quiz_questions_full_data=[]; self.current_question_index=0; self.score=0; self.quiz_topic=""
-        self.generate_button.config(state=tk.NORMAL); self.review_quiz_button.config(state=tk.DISABLED)
+        self.generate_button.config(state=tk.DISABLED if self._gen_inflight else tk.NORMAL); self.review_quiz_button.config(state=tk.DISABLED)
     def reset_quiz_ui_elements(self): # Same
-        self.question_label.config(text=""); self.feedback_label.config(text="",style="TLabel"); self.radio_var.set(None)
+        self.question_label.config(text=""); self.feedback_label.config(text="",style="TLabel"); self.radio_var.set(-1)
         for rb in self.option_buttons: rb.pack_forget()
         self.submit_button.config(text="Submit Answer",state=tk.DISABLED); self.loading_label.config(text="")
     def refresh_data(self): self.reset_quiz_ui(); self.controller.update_status("Ready for new quiz.")
@@ -1030,6 +1562,7 @@ class QuizReviewer(ttk.Frame): # Kept for context, logic same
         self.controller = controller; self.current_review_index = 0; self.pack(fill=tk.BOTH, expand=True)
         self.question_text_label = ttk.Label(self, text="", style="SubHeader.TLabel", wraplength=650, justify=tk.LEFT); self.question_text_label.pack(pady=(0,10), anchor="w")
         self.options_frame = ttk.Frame(self); self.options_frame.pack(pady=5, fill=tk.X, anchor="w")
+        self.opt_labels = [ttk.Label(self.options_frame, text="", wraplength=650) for _ in range(4)] # Built once, reconfigured per question
         self.user_answer_label = ttk.Label(self, text="", font=("Arial", 10), wraplength=650, justify=tk.LEFT); self.user_answer_label.pack(pady=2, anchor="w")
         self.correct_answer_label = ttk.Label(self, text="", font=("Arial", 10, "bold"), wraplength=650, justify=tk.LEFT); self.correct_answer_label.pack(pady=2, anchor="w")
         self.explanation_label = ttk.Label(self, text="", font=("Arial", 10, "italic"), wraplength=650, justify=tk.LEFT); self.explanation_label.pack(pady=(5,10), anchor="w")
@@ -1042,14 +1575,17 @@ class QuizReviewer(ttk.Frame): # Kept for context, logic same
         if not (0 <= self.current_review_index < len(self.quiz_data)): return
         q_item = self.quiz_data[self.current_review_index]
         self.question_text_label.config(text=f"Q{self.current_review_index + 1}: {q_item['question_text']}")
-        for w in self.options_frame.winfo_children(): w.destroy()
-        for i, opt_txt in enumerate(q_item['options']):
+        opts = q_item['options']
+        while len(self.opt_labels) < len(opts): self.opt_labels.append(ttk.Label(self.options_frame, text="", wraplength=650)) # Older attempts may carry more options
+        for lbl in self.opt_labels[len(opts):]: lbl.pack_forget()
+        for i, opt_txt in enumerate(opts):
             opt_lbl_txt = f"  {chr(65+i)}. {opt_txt}"; style = "TLabel"; prefix = "  "
             if i == q_item['correct_option_index']: prefix = "✔ "; style = "Success.TLabel"
             if i == q_item.get('user_answer_index'): 
                 if i == q_item['correct_option_index']: prefix = "✔ "
                 else: prefix = "❌ "; style = "Error.TLabel" if style != "Success.TLabel" else style
-            ttk.Label(self.options_frame, text=f"{prefix}{opt_lbl_txt.strip()}", style=style).pack(anchor="w")
+            lbl = self.opt_labels[i]; lbl.configure(text=f"{prefix}{opt_lbl_txt.strip()}", style=style)
+            if not lbl.winfo_manager(): lbl.pack(anchor="w")
         usr_ans_idx = q_item.get('user_answer_index')
         usr_ans_txt = q_item['options'][usr_ans_idx] if usr_ans_idx is not None and 0 <= usr_ans_idx < len(q_item['options']) else "Not answered"
         self.user_answer_label.config(text=f"Your Answer: {usr_ans_txt}")
@@ -1066,7 +1602,7 @@ class QuizReviewer(ttk.Frame): # Kept for context, logic same
 
 class AIHelperFrame(ttk.Frame): # Kept for context, logic largely same
     def __init__(self, parent, controller):
-        super().__init__(parent); self.controller = controller
+        super().__init__(parent); self.controller = controller; self._help_inflight = False; self._last_input = ""
         ttk.Label(self, text="AI Study Helper (Gemini)", style="Header.TLabel").pack(pady=10) # Clarified Gemini
         input_area = ttk.Frame(self, padding=10); input_area.pack(fill=tk.X, padx=20)
         ttk.Label(input_area, text="Topic, Concept, or Text to Summarize:").pack(anchor="w")
@@ -1086,51 +1622,56 @@ class AIHelperFrame(ttk.Frame): # Kept for context, logic largely same
         self.save_ai_response_button.pack(anchor="e") 
         ttk.Button(self, text="Back to Main Menu", command=lambda: controller.show_frame("MainPage")).pack(pady=10, side=tk.BOTTOM)
         self.current_ai_mode = None 
+    # Fixed per-mode instructions (as QuizFrame.QUIZ_INSTRUCTION): the same prefix for every request in a mode
+    MODE_INSTRUCTIONS = {"explain": {"parts": [{"text": "Explain the topic or concept the student sends, clearly and for a student."}]},
+                         "summarize": {"parts": [{"text": "Summarize the text the student sends, for a student."}]},
+                         "practice_questions": {"parts": [{"text": "Generate 3-4 open-ended/short factual recall practice questions for a student on the topic they send. No answers."}]}}
     def get_ai_help(self, mode): # Same
+        if self._help_inflight: return # One request at a time; buttons come back in _ai_help_finished
         user_input = self.ai_input_text.get("1.0", tk.END).strip()
         if not user_input: messagebox.showwarning("Input Required", "Enter text or topic."); return
         self.current_ai_mode = mode; self.ai_helper_loading_label.config(text="AI thinking...", style="Placeholder.TLabel")
         self.explain_button.config(state=tk.DISABLED); self.summarize_button.config(state=tk.DISABLED); self.practice_q_button.config(state=tk.DISABLED)
         self.save_ai_response_button.config(state=tk.DISABLED)
         self.ai_output_text.config(state=tk.NORMAL); self.ai_output_text.delete("1.0", tk.END); self.ai_output_text.config(state=tk.DISABLED)
-        threading.Thread(target=self._call_ai_for_help, args=(user_input, mode), daemon=True).start()
-    def _call_ai_for_help(self, text_input, mode): # Same
-        api_key = GEMINI_API_KEY or self.controller.db_manager.get_config_value('GEMINI_API_KEY') or ""
-        if not api_key: self.controller.after(0,lambda:self._update_ai_output("Gemini API Key missing.",is_error=True)); self.controller.after(0,self._ai_help_finished); return
-        prompt = ""
-        if mode == "explain": prompt = f"Explain '{text_input}' clearly for a student."
-        elif mode == "summarize": prompt = f"Summarize for a student:\n\n{text_input}"
-        elif mode == "practice_questions": prompt = f"Generate 3-4 open-ended/short factual recall practice questions on '{text_input}' for a student. No answers."
-        else: self.controller.after(0,lambda:self._update_ai_output("Invalid mode.",is_error=True)); self.controller.after(0,self._ai_help_finished); return
-        payload = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
-        try:
-            import requests; r=requests.post(url,headers={'Content-Type':'application/json'},json=payload,timeout=45); r.raise_for_status(); res=r.json()
-            if res.get("candidates") and res["candidates"][0].get("content",{}).get("parts"):
-                ai_txt = res["candidates"][0]["content"]["parts"][0].get("text","No response.").strip()
-                self.controller.after(0,lambda:self._update_ai_output(ai_txt))
-            else: self.controller.after(0,lambda:self._update_ai_output("AI response empty/malformed.",is_error=True))
-        except Exception as e: print(f"AI Helper err: {e}"); self.controller.after(0,lambda:self._update_ai_output(f"Error: {e}",is_error=True))
-        finally: self.controller.after(0,self._ai_help_finished)
+        self._streamed = False; self._help_inflight = True; self._last_input = user_input; self.controller.submit_ai(self._call_ai_for_help, user_input, mode, callback=self._ai_help_done)
+    def _call_ai_for_help(self, text_input, mode): # Pool thread: returns (text, is_error) and never touches Tk
+        if not self.controller.gemini_api_key: return "Gemini API Key missing.", True
+        instruction = self.MODE_INSTRUCTIONS.get(mode)
+        if not instruction: return "Invalid mode.", True
+        payload = {"systemInstruction": instruction, "contents": [{"role": "user", "parts": [{"text": text_input}]}]} # User text goes in alone, never spliced into the instruction
+        text=self.controller.gemini_stream(payload,lambda piece: self.controller.after(0,self._append_ai_chunk,piece),timeout=45,ttl=7*86400,cache_seed=[mode,prompt_key(text_input)],mode=mode,
+                                       similar=None if mode=="summarize" else text_input) # Repeats come from ai_cache for a week; reworded topics via the similarity cache (a near-identical passage may still need its own summary)
+        return (text.strip(), False) if text.strip() else ("AI response empty/malformed.", True)
+    def _append_ai_chunk(self, piece): # Text shows up as it streams in; Save stays disabled until _ai_help_done
+        if not self._streamed: self._streamed = True; self.ai_helper_loading_label.config(text="AI answering...", style="Placeholder.TLabel")
+        self.ai_output_text.config(state=tk.NORMAL); self.ai_output_text.insert(tk.END, piece); self.ai_output_text.config(state=tk.DISABLED)
+    def _ai_help_done(self, fut):
+        try: text, is_error = fut.result()
+        except Exception as e: log.warning("AI Helper err: %s", e); text, is_error = f"Error: {e}", True
+        if is_error or not self._streamed: self._update_ai_output(text, is_error=is_error)
+        else: self.controller.update_status("AI response received.", 3000); self.save_ai_response_button.config(state=tk.NORMAL) # Widget already holds the text
+        self._ai_help_finished()
     def _update_ai_output(self, text, is_error=False): # Same
         self.ai_output_text.config(state=tk.NORMAL); self.ai_output_text.delete("1.0", tk.END)
         self.ai_output_text.insert(tk.END, text); self.ai_output_text.config(state=tk.DISABLED)
         if is_error: self.controller.update_status("AI Helper error.", 3000); self.save_ai_response_button.config(state=tk.DISABLED)
         else: self.controller.update_status("AI response received.", 3000); self.save_ai_response_button.config(state=tk.NORMAL)
     def _ai_help_finished(self): # Same
-        self.ai_helper_loading_label.config(text="")
+        self._help_inflight = False; self.ai_helper_loading_label.config(text="")
         self.explain_button.config(state=tk.NORMAL); self.summarize_button.config(state=tk.NORMAL); self.practice_q_button.config(state=tk.NORMAL)
     def save_ai_response(self): # Same
         if not self.controller.current_user_id: return
         output_text = self.ai_output_text.get("1.0", tk.END).strip()
         if not output_text or output_text == "No response from AI." or "Error contacting AI" in output_text: messagebox.showwarning("Cannot Save", "No valid AI response."); return
         title = self.save_title_entry.get().strip()
+        input_text_for_db = self._last_input # The input this response answers, stashed by get_ai_help (the box may have been edited since)
         if not title: 
-            input_preview = self.ai_input_text.get("1.0", "1.50").strip() 
+            input_preview = input_text_for_db.split("\n", 1)[0][:50].strip() 
             if input_preview: title = f"{self.current_ai_mode.capitalize()}: {input_preview}..."
             else: title = f"{self.current_ai_mode.capitalize()} - {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}"
-        input_text_for_db = self.ai_input_text.get("1.0", tk.END).strip() 
         if self.controller.db_manager.add_ai_content(self.controller.current_user_id, self.current_ai_mode, title, output_text, input_text_for_db):
+            self.controller.mark_dirty("ai")
             messagebox.showinfo("Saved", f"AI response '{title}' saved!"); self.controller.update_status("AI response saved.", 3000); self.save_title_entry.delete(0, tk.END)
         else: messagebox.showerror("Error", "Failed to save AI response."); self.controller.update_status("Failed to save AI response.", 3000)
     def refresh_data(self): # Same
@@ -1149,6 +1690,9 @@ class SettingsFrame(ttk.Frame): # Updated to remove OpenAI API Key field
         self.gemini_api_key_entry = ttk.Entry(api_keys_frame, width=40, show="*")
         self.gemini_api_key_entry.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
         ttk.Button(api_keys_frame, text="Save Gemini Key", command=lambda: self.save_api_key('GEMINI_API_KEY', self.gemini_api_key_entry.get())).grid(row=0, column=2, padx=5)
+        ttk.Label(api_keys_frame, text="Model:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        self.model_combobox = ttk.Combobox(api_keys_frame, state="readonly", values=("Auto (per task)",) + GEMINI_MODELS)
+        self.model_combobox.grid(row=1, column=1, padx=5, pady=5, sticky="w"); self.model_combobox.bind("<<ComboboxSelected>>", lambda e: self.save_model())
         api_keys_frame.columnconfigure(1, weight=1)
 
         cat_frame = ttk.LabelFrame(self, text="Manage Task Categories", padding=10); cat_frame.pack(pady=10, padx=20, fill=tk.X)
@@ -1173,14 +1717,20 @@ class SettingsFrame(ttk.Frame): # Updated to remove OpenAI API Key field
     def save_api_key(self, key_name, key_value):
         if not key_value: messagebox.showwarning("API Key", f"{key_name.replace('_', ' ')} cannot be empty."); return
         self.controller.db_manager.set_config_value(key_name, key_value)
-        messagebox.showinfo("API Key Saved", f"{key_name.replace('_', ' ')} saved. Restart might be needed.")
+        messagebox.showinfo("API Key Saved", f"{key_name.replace('_', ' ')} saved.")
         self.controller.update_status(f"{key_name.replace('_', ' ')} saved.", 3000)
-        if key_name == 'GEMINI_API_KEY': global GEMINI_API_KEY; GEMINI_API_KEY = key_value; self.gemini_api_key_entry.delete(0, tk.END)
+        if key_name == 'GEMINI_API_KEY': global GEMINI_API_KEY; GEMINI_API_KEY = key_value; self.controller.gemini_api_key = key_value; self.gemini_api_key_entry.delete(0, tk.END)
 
     def load_api_keys(self):
-        gemini_key = self.controller.db_manager.get_config_value('GEMINI_API_KEY')
+        gemini_key = self.controller.gemini_api_key # Session cache, kept current by save_api_key/restore
         self.gemini_api_key_entry.delete(0, tk.END)
         if gemini_key: self.gemini_api_key_entry.insert(0, gemini_key) 
+        self.model_combobox.set(self.controller.gemini_model or "Auto (per task)")
+
+    def save_model(self):
+        choice = self.model_combobox.get(); model = choice if choice in GEMINI_MODELS else ""
+        self.controller.db_manager.set_config_value('GEMINI_MODEL', model); self.controller.gemini_model = model
+        self.controller.update_status(f"AI model: {model or 'auto'}.", 3000)
 
     def load_user_categories(self): # Same
         self.category_listbox.delete(0,tk.END)
@@ -1203,23 +1753,34 @@ class SettingsFrame(ttk.Frame): # Updated to remove OpenAI API Key field
         if not self.controller.current_user_id: return
         if messagebox.askyesno("Confirm",f"Delete '{name_del}'? Tasks moved to 'General'."):
             if self.controller.db_manager.delete_task_category(self.controller.current_user_id,name_del):
+                self.controller.mark_dirty("tasks") # Its tasks moved to General
                 self.load_user_categories(); self.controller.update_status(f"Category '{name_del}' deleted.",3000)
             else: messagebox.showerror("Error",f"Failed to delete '{name_del}'."); self.controller.update_status("Delete category failed.",3000)
     def backup_database(self): # Same
         db_p=self.controller.db_manager.db_name; bak_fname=f"aistudy_bak_{datetime.datetime.now().strftime('%y%m%d_%H%M%S')}.db"
         save_p=filedialog.asksaveasfilename(initialfile=bak_fname,defaultextension=".db",filetypes=[("DB","*.db")],title="Save DB Backup")
         if not save_p: return
-        try: shutil.copy2(db_p,save_p); messagebox.showinfo("Backup OK",f"DB backed up to:\n{save_p}"); self.controller.update_status("DB backup OK.",3000)
+        try: self.controller.db_manager.checkpoint(); shutil.copy2(db_p,save_p); messagebox.showinfo("Backup OK",f"DB backed up to:\n{save_p}"); self.controller.update_status("DB backup OK.",3000)
         except Exception as e: messagebox.showerror("Backup Fail",f"Backup error: {e}"); self.controller.update_status("DB backup fail.",3000)
     def restore_database(self): # Same
         if not messagebox.askokcancel("Confirm","Restore DB will OVERWRITE current data.\nBackup current DB first.\nProceed?"): return
         bak_p=filedialog.askopenfilename(defaultextension=".db",filetypes=[("DB","*.db")],title="Select DB Backup")
         if not bak_p: return
+        wait=tk.Toplevel(self.controller); wait.title("Restoring"); wait.transient(self.controller); wait.protocol("WM_DELETE_WINDOW",lambda: None)
+        ttk.Label(wait,text="Waiting for background work to finish...",padding=20).pack(); wait.grab_set() # No new DB/AI work until the copy is done
+        self.controller.update_status("Waiting for background work before restore...",0); self.controller.flush_chats(False)
+        self.controller.pause_workers(lambda: self._finish_restore(bak_p,wait))
+    def _finish_restore(self, bak_p, wait): # Tk thread, with the DB worker and AI pool drained and stopped
         curr_db_p=self.controller.db_manager.db_name
         try:
-            shutil.copy2(bak_p,curr_db_p); messagebox.showinfo("Restore OK",f"DB restored from:\n{bak_p}\n\nRestart app recommended.")
+            self.controller.db_manager.close() # Release open connections before overwriting the file
+            shutil.copy2(bak_p,curr_db_p); err=None
+        except Exception as e: err=e
+        finally: self.controller.start_workers(); self.controller.mark_dirty(); wait.grab_release(); wait.destroy()
+        if err is None:
+            self.controller.load_gemini_api_key(); messagebox.showinfo("Restore OK",f"DB restored from:\n{bak_p}\n\nRestart app recommended.")
             self.controller.update_status("DB restore OK. Restart app.",0); self.controller.logout_user()
-        except Exception as e: messagebox.showerror("Restore Fail",f"Restore error: {e}"); self.controller.update_status("DB restore fail.",3000)
+        else: messagebox.showerror("Restore Fail",f"Restore error: {err}"); self.controller.update_status("DB restore fail.",3000)
     def refresh_data(self): 
         self.load_user_categories()
         self.load_api_keys() 
@@ -1240,85 +1801,72 @@ class AnalyticsFrame(ttk.Frame): # Kept for context, logic largely same
         self.points_label = ttk.Label(gamify_frame, text="Learning Points: ...", font=("Arial", 10))
         self.points_label.pack(anchor=tk.W, padx=20, pady=2)
         btn_frame = ttk.Frame(self); btn_frame.pack(pady=10, side=tk.BOTTOM, fill=tk.X, padx=20)
-        ttk.Button(btn_frame, text="Refresh", command=self.refresh_data).pack(side=tk.LEFT, expand=True, padx=5) 
+        ttk.Button(btn_frame, text="Refresh", command=lambda: self.refresh_data(force=True)).pack(side=tk.LEFT, expand=True, padx=5) 
         ttk.Button(btn_frame, text="Back", command=lambda: controller.show_frame("MainPage")).pack(side=tk.LEFT, expand=True, padx=5) 
-    def calculate_study_streak(self, study_logs_data): # Corrected logic
-        if not study_logs_data: return 0
-        unique_study_dates = set()
-        for log_item in study_logs_data: # log_id, subject, start_time, duration, notes
-            try:
-                date_obj = datetime.datetime.strptime(log_item[2].split(" ")[0], "%Y-%m-%d").date() # start_time is at index 2
-                unique_study_dates.add(date_obj)
-            except (ValueError, IndexError):
-                print(f"Warning: Could not parse date from study_log start_time: {log_item[2] if len(log_item) > 2 else 'INVALID LOG ITEM'}")
-                continue
-        if not unique_study_dates: return 0
-        today = datetime.date.today(); current_streak = 0
-        # Check if studied today or yesterday to even consider a current streak
-        if not (today in unique_study_dates or (today - datetime.timedelta(days=1)) in unique_study_dates):
-            return 0
-        check_date = today
-        while check_date in unique_study_dates:
-            current_streak += 1
-            check_date -= datetime.timedelta(days=1)
-        # If today was not a study day, but yesterday was, the loop above would result in streak = 0.
-        # This additional check ensures that if the streak ended yesterday, it's counted as 1.
-        if current_streak == 0 and (today - datetime.timedelta(days=1)) in unique_study_dates:
-            current_streak = 1 # For yesterday
-            check_date = today - datetime.timedelta(days=2) # Start checking from day before yesterday
-            while check_date in unique_study_dates:
-                current_streak +=1
-                check_date -= datetime.timedelta(days=1)
-        return current_streak
-
-    def refresh_data(self): # Same
+        self._sections = {}; self._sections_day = None # domain -> (text, values), see refresh_data
+    def _task_section(self, db, uid): # Each _*_section returns (text, values the labels need)
+        total_t,comp_t=db.get_task_stats(uid); pend_t=total_t-comp_t # Aggregates come back from SQLite as a few scalars, not every row
+        comp_rate=(comp_t/total_t*100) if total_t>0 else 0
+        return f"{'[Task Management ]':<28}\n Total Tasks: {total_t}\n Completed: {comp_t}\n Pending: {pend_t}\n Rate: {comp_rate:.1f}%\n\n", (comp_t,)
+    def _study_section(self, db, uid, today):
+        total_s_sess,total_s_time_m,d_s_7,d_s_30=db.get_study_stats(uid,(7,30)) # Totals and both consistency windows in one scan
+        parts=[f"{'[Study Tracking ]':<28}\n Sessions: {total_s_sess}\n Total Time: {total_s_time_m//60}h {total_s_time_m%60}m\n",
+               f" Days Studied (Last 7): {d_s_7}\n Days Studied (Last 30): {d_s_30}\n"] # Joined once at the end, no intermediate strings
+        top_subj=db.get_subject_time_top(uid,3)
+        if top_subj: parts.append(" Top Subjects (Time):\n")
+        parts.extend(f"  - {s[:20]:<22}: {t_v//60}h {t_v%60}m\n" for s,t_v in top_subj); parts.append("\n")
+        return "".join(parts), (total_s_sess, f"Consistency: {d_s_7}/7d (wk), {d_s_30}/30d (mth)", study_streak(db.get_study_dates(uid), today.toordinal()))
+    def _quiz_section(self, db, uid):
+        total_q_taken,total_corr_ans,total_p_s=db.get_quiz_stats(uid); avg_s_pc=(total_corr_ans/total_p_s*100) if total_p_s>0 else 0.0
+        q_atts=db.get_quiz_attempts(uid,3) or []
+        parts=[f"{'[Quiz Performance ]':<28}\n Quizzes Taken: {total_q_taken}\n Avg Score: {avg_s_pc:.2f}%\n"]
+        if q_atts: parts.append(" Recent Quizzes (Top 3):\n")
+        for att in q_atts:
+            d=att[2] or ""; d_disp=d[2:10] if len(d)>=10 and d[4]=='-' and d[7]=='-' else "N/A" # '%y-%m-%d' is a slice of the stored 'YYYY-MM-DD ...'
+            parts.append(f"  - {d_disp} | {att[1][:15]:<15} | {att[3]}/{att[4]}\n")
+        parts.append("\n")
+        return "".join(parts), (total_corr_ans,)
+
+    def refresh_data(self, force=False): # Same
         if not self.controller.current_user_id:
             self.stats_text.config(state=tk.NORMAL); self.stats_text.delete("1.0",tk.END); self.stats_text.insert(tk.END,"Log in for analytics."); self.stats_text.config(state=tk.DISABLED)
             self.streak_label.config(text="Study Streak: N/A"); self.points_label.config(text="Learning Points: N/A"); self.consistency_label.config(text="Consistency: N/A")
             self.controller.show_frame("LoginPage"); return
-        uid=self.controller.current_user_id; stats=f"Analytics for {self.controller.current_username}:\n{'-'*50}\n\n"
-        tasks=self.controller.db_manager.get_tasks(uid,True); total_t=len(tasks) if tasks else 0
-        comp_t=len([t for t in tasks if t[4]]) if tasks else 0; pend_t=total_t-comp_t
-        comp_rate=(comp_t/total_t*100) if total_t>0 else 0
-        stats+=f"{'[Task Management ]':<28}\n Total Tasks: {total_t}\n Completed: {comp_t}\n Pending: {pend_t}\n Rate: {comp_rate:.1f}%\n\n"
-        s_logs=self.controller.db_manager.get_study_logs(uid); total_s_sess=len(s_logs) if s_logs else 0
-        total_s_time_m=sum(log[3] for log in s_logs) if s_logs else 0 # duration_minutes is at index 3
-        stats+=f"{'[Study Tracking ]':<28}\n Sessions: {total_s_sess}\n Total Time: {total_s_time_m//60}h {total_s_time_m%60}m\n"
-        d_s_7=self.controller.db_manager.get_study_days_count(uid,7); d_s_30=self.controller.db_manager.get_study_days_count(uid,30)
-        self.consistency_label.config(text=f"Consistency: {d_s_7}/7d (wk), {d_s_30}/30d (mth)")
-        stats+=f" Days Studied (Last 7): {d_s_7}\n Days Studied (Last 30): {d_s_30}\n"
-        if s_logs:
-            subj_t={}; 
-            for log in s_logs: subj_t[log[1]]=subj_t.get(log[1],0)+log[3] # subject at index 1, duration at index 3
-            if subj_t: stats+=" Top Subjects (Time):\n"; 
-            for s,t_v in sorted(subj_t.items(),key=lambda i:i[1],reverse=True)[:3]: stats+=f"  - {s[:20]:<22}: {t_v//60}h {t_v%60}m\n" 
-        stats+="\n"
-        q_atts=self.controller.db_manager.get_quiz_attempts(uid); total_q_taken=len(q_atts) if q_atts else 0
-        avg_s_pc=0.0; total_corr_ans=0
-        if q_atts:
-            total_s_ach=sum(att[3] for att in q_atts); total_p_s=sum(att[4] for att in q_atts); total_corr_ans=total_s_ach
-            if total_p_s>0: avg_s_pc=(total_s_ach/total_p_s)*100
-        stats+=f"{'[Quiz Performance ]':<28}\n Quizzes Taken: {total_q_taken}\n Avg Score: {avg_s_pc:.2f}%\n"
-        if q_atts: stats+=" Recent Quizzes (Top 3):\n"; 
-        for att in q_atts[:3]:
-            try: dt_o=datetime.datetime.strptime(att[2],"%Y-%m-%d %H:%M:%S"); d_disp=dt_o.strftime("%y-%m-%d")
-            except ValueError: d_disp="N/A"
-            stats+=f"  - {d_disp} | {att[1][:15]:<15} | {att[3]}/{att[4]}\n" 
-        stats+="\n"; self.stats_text.config(state=tk.NORMAL); self.stats_text.delete("1.0",tk.END)
+        uid=self.controller.current_user_id; today=datetime.date.today(); secs=self._sections
+        if force or self._sections_day!=today: secs.clear(); self._sections_day=today # Day windows and the streak move at midnight
+        # A section is rebuilt only when its data_version (or the user) changed since it was last shown
+        stale=[d for d in ("tasks","logs","quiz") if self.controller.needs_reload(self,d) or d not in secs]
+        if not stale: self._render_analytics(); return
+        if len(stale)==3: self.stats_text.config(state=tk.NORMAL); self.stats_text.delete("1.0",tk.END); self.stats_text.insert(tk.END,"Loading analytics..."); self.stats_text.config(state=tk.DISABLED)
+        self.controller.update_status("Loading analytics...")
+        self.controller.db_worker.submit(self._build_sections,uid,stale,today,callback=lambda built: self._sections_ready(uid,today,built))
+    def _build_sections(self, uid, domains, today): # DB worker thread: queries and formatting only, no Tk
+        db=self.controller.db_manager; build={"tasks":lambda: self._task_section(db,uid),"logs":lambda: self._study_section(db,uid,today),"quiz":lambda: self._quiz_section(db,uid)}
+        return {d: build[d]() for d in domains}
+    def _sections_ready(self, uid, today, built):
+        if uid!=self.controller.current_user_id or today!=self._sections_day: return # Stale answer: user or day changed while it was queued
+        if built is None: self._sections.clear(); self.controller.update_status("Analytics failed to load.",3000); return # Next visit retries everything
+        self._sections.update(built)
+        if len(self._sections)==3: self._render_analytics() # Else a forced refresh cleared the rest and its own answer is still queued
+    def _render_analytics(self):
+        secs=self._sections
+        (t_txt,(comp_t,)),(s_txt,(total_s_sess,consistency,streak)),(q_txt,(total_corr_ans,))=secs["tasks"],secs["logs"],secs["quiz"]
+        stats="".join((f"Analytics for {self.controller.current_username}:\n{'-'*50}\n\n",t_txt,s_txt,q_txt))
+        self.stats_text.config(state=tk.NORMAL); self.stats_text.delete("1.0",tk.END)
         self.stats_text.insert(tk.END,stats); self.stats_text.config(state=tk.DISABLED)
-        current_streak_val = self.calculate_study_streak(s_logs if s_logs else []) # Use corrected method
-        self.streak_label.config(text=f"Study Streak: {current_streak_val} day(s)") 
+        self.consistency_label.config(text=consistency); self.streak_label.config(text=f"Study Streak: {streak} day(s)") 
         pts=(comp_t*10)+(total_s_sess*5)+total_corr_ans; self.points_label.config(text=f"Learning Points: {pts}") 
         self.controller.update_status("Analytics refreshed.",3000)
 
 
 # --- Gemini Chat Frame (Replaces OpenAIChatFrame) ---
 class GeminiChatFrame(ttk.Frame):
+    _TAGS = {"user": (("timestamp_user",), ("user",), "You"), "model": (("timestamp_model",), ("model",), "Gemini AI")} # role -> header tags, body tags, display name
     def __init__(self, parent, controller):
         super().__init__(parent)
         self.controller = controller
-        self.chat_history_for_api = [] 
-        self.gemini_api_key = None 
+        self.chat_history_for_api = collections.deque(maxlen=20) # Context sent with each message; older turns fall off on append
+        self.gemini_api_key = None; self._reply_open = False # True while a streamed reply is being appended
 
         ttk.Label(self, text="AI Chat Assistant (Gemini)", style="Header.TLabel").pack(pady=10)
 
@@ -1354,7 +1902,7 @@ class GeminiChatFrame(ttk.Frame):
         if not user_message_content: return
         if not self.controller.current_user_id: messagebox.showerror("Error", "User not logged in."); return
         
-        self.gemini_api_key = GEMINI_API_KEY or self.controller.db_manager.get_config_value('GEMINI_API_KEY')
+        self.gemini_api_key = self.controller.gemini_api_key
         if not self.gemini_api_key:
             self._display_message_in_chat("Gemini API Key not set. Please set it in Settings.", "error")
             return
@@ -1362,32 +1910,23 @@ class GeminiChatFrame(ttk.Frame):
         self.chat_input_entry.delete(0, tk.END)
         self._add_message_to_display("user", user_message_content) 
         self.chat_history_for_api.append({"role": "user", "parts": [{"text": user_message_content}]})
-        self.controller.db_manager.add_chat_message(self.controller.current_user_id, "user", user_message_content)
+        self.controller.queue_chat_message(self.controller.current_user_id, "user", user_message_content)
         
         self.chat_loading_label.config(text="AI is thinking...")
         self.send_button.config(state=tk.DISABLED)
 
-        thread = threading.Thread(target=self._get_gemini_response, daemon=True)
-        thread.start()
+        self.controller.ai_pool.submit(self._get_gemini_response, list(self.chat_history_for_api)) # Snapshot taken on the Tk thread
 
-    def _get_gemini_response(self):
-        context_messages_for_api = self.chat_history_for_api[-20:] 
+    def _get_gemini_response(self, context_messages_for_api):
         payload = {"contents": context_messages_for_api}
-        api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={self.gemini_api_key}"
 
         try:
-            import requests
-            response = requests.post(api_url, headers={'Content-Type': 'application/json'}, json=payload, timeout=60)
-            response.raise_for_status()
-            result = response.json()
-            
-            ai_response_content = "Sorry, I couldn't get a response from Gemini."
-            if result.get("candidates") and result["candidates"][0].get("content") and result["candidates"][0]["content"].get("parts"):
-                ai_response_content = result["candidates"][0]["content"]["parts"][0].get("text", ai_response_content).strip()
-            
-            self.controller.after(0, lambda: self._add_message_to_display("model", ai_response_content)) 
+            import requests # For its exception types; the call itself goes through the shared keep-alive session
+            text = self.controller.gemini_stream(payload, lambda piece: self.controller.after(0, self._append_reply_chunk, piece), timeout=60, ttl=0, mode="chat") # Conversations are never cached
+            ai_response_content = text.strip() or "Sorry, I couldn't get a response from Gemini."
+            self.controller.after(0, self._end_reply, None if text.strip() else ai_response_content) 
             self.chat_history_for_api.append({"role": "model", "parts": [{"text": ai_response_content}]})
-            self.controller.db_manager.add_chat_message(self.controller.current_user_id, "model", ai_response_content) 
+            self.controller.queue_chat_message(self.controller.current_user_id, "model", ai_response_content) 
 
         except requests.exceptions.HTTPError as http_err:
             err_detail = str(http_err)
@@ -1402,25 +1941,38 @@ class GeminiChatFrame(ttk.Frame):
         finally:
             self.controller.after(0, self._gemini_response_finished)
 
+    def _append_reply_chunk(self, piece): # The reply grows in place as SSE pieces arrive; the header goes in with the first one
+        self.chat_display.config(state=tk.NORMAL)
+        ts_tag, role_tag, display_name = self._TAGS["model"]
+        if not self._reply_open: self._reply_open = True; self.chat_display.insert(tk.END, f"{display_name} ({time.strftime('%H:%M:%S')})\n", ts_tag)
+        self.chat_display.insert(tk.END, piece, role_tag); self.chat_display.config(state=tk.DISABLED); self.chat_display.see(tk.END)
+
+    def _end_reply(self, fallback=None):
+        """Closes a streamed reply, or shows `fallback` as a whole message if nothing was streamed."""
+        if self._reply_open:
+            self._reply_open = False; self.chat_display.config(state=tk.NORMAL); self.chat_display.insert(tk.END, "\n\n", self._TAGS["model"][1]); self.chat_display.config(state=tk.DISABLED)
+        elif fallback: self._add_message_to_display("model", fallback)
+
     def _gemini_response_finished(self):
         self.chat_loading_label.config(text="")
         self.send_button.config(state=tk.NORMAL)
 
     def _add_message_to_display(self, role, content): 
+        self._add_messages_to_display([(role, content, time.strftime("%H:%M:%S"))])
+
+    def _add_messages_to_display(self, messages):
+        """Appends (role, content, 'HH:MM:SS') messages with one insert and one state toggle, however many there are."""
+        args = []
+        for role, content, timestamp_str in messages:
+            ts_tag, role_tag, display_name = self._TAGS[role]
+            args += (f"{display_name} ({timestamp_str})\n", ts_tag, content + "\n\n", role_tag) # Header, then body in the role's tag
         self.chat_display.config(state=tk.NORMAL)
-        timestamp_str = datetime.datetime.now().strftime("%H:%M:%S")
-        
-        display_role_tag = role 
-        timestamp_tag = f"timestamp_{role}" 
-        display_name = "You" if role == "user" else "Gemini AI"
-
-        self.chat_display.insert(tk.END, f"{display_name} ({timestamp_str})\n", (timestamp_tag,))
-        self.chat_display.insert(tk.END, content + "\n\n", (display_role_tag,))
-        
+        self.chat_display.insert(tk.END, *args)
         self.chat_display.config(state=tk.DISABLED)
         self.chat_display.see(tk.END)
 
     def _display_message_in_chat(self, message, tag=None): 
+        self._end_reply() # An error can cut a streamed reply short
         self.chat_display.config(state=tk.NORMAL)
         if tag: self.chat_display.insert(tk.END, message + "\n\n", (tag,))
         else: self.chat_display.insert(tk.END, message + "\n\n")
@@ -1428,30 +1980,32 @@ class GeminiChatFrame(ttk.Frame):
         self.chat_display.see(tk.END)
 
     def refresh_data(self):
-        self.gemini_api_key = GEMINI_API_KEY or self.controller.db_manager.get_config_value('GEMINI_API_KEY')
+        self.gemini_api_key = self.controller.gemini_api_key
         
-        self.chat_display.config(state=tk.NORMAL); self.chat_display.delete("1.0", tk.END); self.chat_display.config(state=tk.DISABLED)
+        self.chat_display.config(state=tk.NORMAL); self.chat_display.delete("1.0", tk.END); self.chat_display.config(state=tk.DISABLED); self._reply_open = False
         if not self.controller.current_user_id: self.controller.show_frame("LoginPage"); return
         
         if not self.gemini_api_key:
             self._display_message_in_chat("Gemini API Key not set. Configure in Settings.", "error")
-            self.send_button.config(state=tk.DISABLED)
-        else:
-            self.send_button.config(state=tk.NORMAL)
+        self.send_button.config(state=tk.DISABLED) # Until the replay is in, so a new message can't land above it
             
-        self.chat_history_for_api = [] 
-        db_chat_history = self.controller.db_manager.get_chat_history(self.controller.current_user_id, limit=20) 
-        
+        self.chat_history_for_api.clear() 
+        self.controller.flush_chats(False) # Queued ahead of the read below, so buffered messages are part of the replay
+        uid = self.controller.current_user_id
+        self.controller.db_worker.submit(self.controller.db_manager.get_chat_history, uid, 20, True, callback=lambda rows: self._replay_history(uid, rows))
+
+    def _replay_history(self, uid, db_chat_history):
+        if uid != self.controller.current_user_id: return # Logged out/in while the read was queued
         if db_chat_history:
-            for record in db_chat_history: 
-                role, content, ts_str = record 
-                self._add_message_to_display(role, content) 
-                self.chat_history_for_api.append({"role": role, "parts": [{"text": content}]}) 
+            self._add_messages_to_display(db_chat_history) # Whole replay in one insert, each with its own stored time
+            self.chat_history_for_api.extend({"role": role, "parts": [{"text": content}]} for role, content, ts_str in db_chat_history)
+        if self.gemini_api_key: self.send_button.config(state=tk.NORMAL)
         self.controller.update_status("Gemini Chat ready. API key required.")
 
 
 # --- Entry Point ---
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
     db_manager = DatabaseManager(DATABASE_NAME)
     db_manager.init_db() 
     if not GEMINI_API_KEY: 